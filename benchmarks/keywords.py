@@ -0,0 +1,102 @@
+'''
+Benchmark of the keyword matching of channel downloads, KeywordMatcher against the implementation it replaced.
+Runs in memory on synthetic videos, no server needed:
+
+    python benchmarks/keywords.py --videos 20000
+'''
+import re
+import sys
+import json
+import random
+import argparse
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mytube_core import KeywordMatcher, CachedVideo
+
+WORDS = [
+    'news', 'sport', 'tech', 'tips', 'review', 'unboxing', 'gpu', 'cpu', 'benchmark', 'live', 'music', 'cover',
+    'tutorial', 'python', 'cooking', 'travel', 'vlog', 'highlights', 'interview', 'podcast', 'gaming', 'build'
+    ]
+# Expressions the replaced implementation understands, so both can be timed on them
+LEGACY_EXPRESSIONS = ['news', 'news, sport, tech tips', 'python, tutorial, cooking, travel, vlog, podcast']
+
+
+class Video:
+    '''The fields of a CachedVideo the keyword matching looks at.'''
+    def __init__(self, title: str, keywords: list) -> None:
+        self.title = title
+        self.keywords = keywords
+
+
+def synthetic_videos(count: int, seed: int = 1):
+    '''Returns count videos with random titles of 8 words and 12 keywords, the same ones for the same seed.'''
+    generator = random.Random(seed)
+    return [
+        Video(' '.join(generator.choice(WORDS).capitalize() for _ in range(8)), [generator.choice(WORDS) for _ in range(12)])
+        for _ in range(count)
+        ]
+
+
+def legacy_match_keywords(keywords: str, video: CachedVideo):
+    '''ChannelFilter.video_match_keywords as it was before KeywordMatcher, kept to benchmark against.'''
+    user_keywords = keywords.split(',')
+
+    # Default, no keywords
+    if len(user_keywords) == 0:
+        return True
+
+    for video_keyword in video.keywords:
+        for user_keyword in user_keywords:
+            user_keyword = user_keyword.strip().lower()
+            video_keyword = video_keyword.strip().lower()
+            video_title = video.title.lower()
+
+            user_keyword_in_video_title = re.search(re.compile(fr'{user_keyword}'), video_title)
+
+            if user_keyword == video_keyword or user_keyword_in_video_title is not None:
+                return True
+
+    return False
+
+
+def match_legacy(expression: str, videos: list):
+    return sum(legacy_match_keywords(expression, video) for video in videos)
+
+
+def match(expression: str, videos: list):
+    # Parsed once per channel download, so parsing is part of the timing
+    matcher = KeywordMatcher(expression)
+    return sum(matcher.matches(video.title, video.keywords) for video in videos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times KeywordMatcher against the keyword matching it replaced.')
+    parser.add_argument('--videos', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    videos = synthetic_videos(args.videos)
+    results = []
+    for expression in LEGACY_EXPRESSIONS + ['(gpu OR cpu) AND benchmark AND NOT unboxing']:
+        result = {'expression' : expression}
+        implementations = [('keyword_matcher', match)]
+        if expression in LEGACY_EXPRESSIONS:
+            implementations.append(('legacy', match_legacy))
+        for name, function in implementations:
+            timings = []
+            for _ in range(args.repeat):
+                started = perf_counter()
+                matched = function(expression, videos)
+                timings.append(perf_counter() - started)
+            result[name] = {'best_s' : round(min(timings), 4), 'videos_matched' : matched}
+        if 'legacy' in result:
+            result['speedup'] = round(result['legacy']['best_s'] / result['keyword_matcher']['best_s'], 1)
+        results.append(result)
+    print(json.dumps({'videos' : args.videos, 'results' : results}, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+'''
+Offline benchmarks of MyTube, against the local stand-in server of standin.py instead of YouTube.
+Times single video downloads, channel filtering, playlist downloads and the startup of the app,
+and writes the results as JSON, so runs on the same machine can be compared, e.g. in CI:
+
+    python benchmarks/run.py --output baseline.json
+    python benchmarks/run.py --output results.json --compare baseline.json
+
+With --compare, exits with status 1 if any benchmark got slower than the baseline by more than the tolerance.
+'''
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from statistics import median
+from time import perf_counter
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+# The app keeps its caches and queues in the home directory, the benchmarks get a temporary one
+HOME_DIR = Path(tempfile.mkdtemp(prefix='mytube-benchmarks-'))
+os.environ['HOME'] = os.environ['USERPROFILE'] = str(HOME_DIR)
+sys.path.insert(0, str(REPO_DIR))
+
+import pytube
+from pytube import Channel
+from standin import StandInServer, YOUTUBE_HOSTS, STREAM_HOST, CHANNEL_NAME
+from keywords import synthetic_videos, match, match_legacy
+from mytube_core import POOL, VideoDownloader, VideoEnumerator, ChannelFilter, MetadataCache, DownloadLedger, JobQueue, BatchDownloader, PlaylistDiscovery
+
+SCHEMA_VERSION = 1
+DEFAULT_TOLERANCE = 0.25
+KEYWORD_VIDEOS = 20000
+KEYWORDS = 'news, sport, tech tips'
+
+
+class BenchmarkSkipped(Exception):
+    '''Raised when a benchmark cannot run here, e.g. the app startup without a display.'''
+
+
+class Benchmarks:
+    '''The benchmarks, each run against the stand-in server with caches of its own.'''
+    def __init__(self, server: StandInServer, work_dir: Path, workers: int = 3) -> None:
+        self.server = server
+        self.work_dir = work_dir
+        self.workers = workers
+        self.runs = 0
+
+    def _run_dir(self):
+        self.runs += 1
+        run_dir = self.work_dir.joinpath(f'run-{self.runs}')
+        run_dir.mkdir(parents=True)
+        return run_dir
+
+    def download_video(self, connections: int):
+        downloader = VideoDownloader(self.server.video_url(0), save_directory=self._run_dir(), resolution='720p')
+        downloader.set_connections(connections)
+        downloader.download_video()
+        return {'bytes' : os.path.getsize(downloader.output_path)}
+
+    def filter_channel_videos(self, metadata_cache: MetadataCache = None):
+        if metadata_cache is None:
+            metadata_cache = MetadataCache(self._run_dir().joinpath('metadata.sqlite3'))
+        channel = Channel(f'https://www.youtube.com/c/{CHANNEL_NAME}')
+        videos = ChannelFilter(metadata_cache, 'All Time', 'even').filter_channel_videos(VideoEnumerator(channel))
+        return {'videos_matched' : len(videos)}
+
+    def discover_playlists(self):
+        # The channel's playlists page and its continuations
+        return {'playlists' : len(PlaylistDiscovery().get_playlists(CHANNEL_NAME))}
+
+    def _batch_downloader(self):
+        run_dir = self._run_dir()
+        downloader = BatchDownloader(save_dir=str(run_dir), resolution='360p', workers=self.workers)
+        downloader.metadata_cache = MetadataCache(run_dir.joinpath('metadata.sqlite3'))
+        downloader.ledger = DownloadLedger(run_dir.joinpath('downloads.sqlite3'))
+        downloader.queue = JobQueue(run_dir.joinpath('jobs.sqlite3'))
+        return downloader
+
+    def download_playlist(self):
+        return self._batch_result(self._batch_downloader().download_playlist(self.server.playlist_url))
+
+    def download_channel(self):
+        # The even videos of the past month, resolved and filtered while the first ones download
+        return self._batch_result(self._batch_downloader().download_channel(CHANNEL_NAME, 'Month', 'even'))
+
+    def _batch_result(self, result):
+        if result.failed:
+            url, error = result.failed[0]
+            raise RuntimeError(f'{len(result.failed)} downloads failed, e.g. {url}: {error}')
+        return {
+            'videos' : len(result.downloaded),
+            'bytes' : sum(os.path.getsize(video['path']) for video in result.downloaded)
+            }
+
+    def import_core(self):
+        subprocess.run([sys.executable, '-c', 'import mytube_core'], cwd=REPO_DIR, check=True)
+
+    def startup(self):
+        completed = subprocess.run(
+            [sys.executable, 'mytube_app.py', '--startup-time'],
+            cwd=REPO_DIR, capture_output=True, text=True, timeout=120
+            )
+        if completed.returncode != 0:
+            # Usually no display to open the window on
+            reason = (completed.stderr.strip().splitlines() or ['the app exited with an error'])[-1]
+            raise BenchmarkSkipped(reason)
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def measure(server: StandInServer, function, repeat: int):
+    '''Runs the function "repeat" times, and returns its timings, the details it returned and the requests it made.'''
+    server.stats()
+    pool_before = POOL.stats()
+    timings = []
+    details = {}
+    try:
+        for _ in range(repeat):
+            started = perf_counter()
+            details = function() or {}
+            timings.append(perf_counter() - started)
+    except BenchmarkSkipped as skipped:
+        return {'skipped' : str(skipped)}
+    pool_after = POOL.stats()
+
+    result = {
+        'median_s' : round(median(timings), 4),
+        'min_s' : round(min(timings), 4),
+        'max_s' : round(max(timings), 4),
+        'runs_s' : [round(seconds, 4) for seconds in timings],
+        **details,
+        'server' : server.stats(),
+        'connections_opened' : pool_after['connections_opened'] - pool_before['connections_opened']
+        }
+    if 'bytes' in details:
+        result['mb_per_s'] = round(details['bytes'] / 1048576 / median(timings), 2)
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'python' : platform.python_version(),
+        'implementation' : platform.python_implementation(),
+        'platform' : platform.platform(),
+        'cpu_count' : os.cpu_count(),
+        'pytube' : pytube.__version__,
+        'commit' : commit or None
+        }
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    '''Prints the results next to the baseline to stderr, and returns the names of the benchmarks which got slower than the tolerance allows.'''
+    if results['server'] != baseline.get('server'):
+        print('Note: the baseline was run with other stand-in server settings, the timings may not be comparable', file=sys.stderr)
+
+    regressions = []
+    print(f'{"benchmark":<32}{"baseline":>10}{"current":>10}{"change":>9}', file=sys.stderr)
+    for name, result in results['benchmarks'].items():
+        baseline_result = baseline.get('benchmarks', {}).get(name, {})
+        if 'median_s' not in result or 'median_s' not in baseline_result:
+            continue
+        change = result['median_s'] / baseline_result['median_s'] - 1
+        flag = ''
+        if change > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:<32}{baseline_result["median_s"]:>9.3f}s{result["median_s"]:>9.3f}s{change:>+9.0%}{flag}', file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks MyTube against a local stand-in for YouTube, without network access.')
+    parser.add_argument('--output', '-o', help='file to write the JSON results to, instead of printing them')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help=f'allowed slowdown against the baseline, default {DEFAULT_TOLERANCE} (= 25%%)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the median is compared')
+    parser.add_argument('--only', help='comma separated names of the benchmarks to run')
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds the stand-in server adds to every response')
+    parser.add_argument('--bandwidth', type=float, default=8388608, help='bytes per second per stream, 0 = unlimited')
+    parser.add_argument('--videos', type=int, default=250, help='videos of the stand-in channel')
+    parser.add_argument('--playlist-length', type=int, default=10, help='videos of the stand-in playlist')
+    parser.add_argument('--video-size', type=int, default=8388608, help='bytes of the 720p stream of a video, the 360p one is half')
+    args = parser.parse_args()
+
+    server = StandInServer(0, args.latency, args.bandwidth, args.videos, args.playlist_length, args.video_size).start()
+    POOL.route(YOUTUBE_HOSTS + [STREAM_HOST], server.base_url)
+    benchmarks = Benchmarks(server, HOME_DIR.joinpath('runs'))
+    warm_cache = MetadataCache(HOME_DIR.joinpath('warm-metadata.sqlite3'))
+    keyword_videos = synthetic_videos(KEYWORD_VIDEOS)
+    suite = {
+        'import_core' : benchmarks.import_core,
+        'startup' : benchmarks.startup,
+        'download_video' : lambda: benchmarks.download_video(1),
+        'download_video_4_connections' : lambda: benchmarks.download_video(4),
+        'filter_channel_videos' : benchmarks.filter_channel_videos,
+        'filter_channel_videos_cached' : lambda: benchmarks.filter_channel_videos(warm_cache),
+        'download_playlist' : benchmarks.download_playlist,
+        'download_channel' : benchmarks.download_channel,
+        'discover_playlists' : benchmarks.discover_playlists,
+        'match_keywords' : lambda: {'videos_matched' : match(KEYWORDS, keyword_videos)},
+        'match_keywords_legacy' : lambda: {'videos_matched' : match_legacy(KEYWORDS, keyword_videos)}
+        }
+    names = list(suite)
+    if args.only:
+        names = [name.strip() for name in args.only.split(',')]
+        unknown = [name for name in names if name not in suite]
+        if unknown:
+            parser.error(f'unknown benchmarks: {", ".join(unknown)}, choose from {", ".join(suite)}')
+
+    results = {
+        'schema' : SCHEMA_VERSION,
+        'started_at' : datetime.now().isoformat(timespec='seconds'),
+        'environment' : environment(),
+        'server' : {
+            'latency_s' : args.latency,
+            'bandwidth' : args.bandwidth,
+            'videos' : args.videos,
+            'playlist_length' : args.playlist_length,
+            'video_size' : args.video_size
+            },
+        'repeat' : args.repeat,
+        'benchmarks' : {}
+        }
+    try:
+        for name in names:
+            print(f'Running {name}', file=sys.stderr)
+            if name == 'filter_channel_videos_cached':
+                # Fill the cache first, only the runs with every video already cached are timed
+                benchmarks.filter_channel_videos(warm_cache)
+            results['benchmarks'][name] = measure(server, suite[name], args.repeat)
+    finally:
+        server.stop()
+        shutil.rmtree(HOME_DIR, ignore_errors=True)
+
+    output = json.dumps(results, indent=4)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f'Slower than the baseline: {", ".join(regressions)}', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+'''
+Local stand-in for the parts of YouTube MyTube talks to, so the benchmarks run without network access.
+Serves synthetic watch pages, player responses (stream manifests), a player base.js,
+playlist, channel and channel playlists pages with their continuations, and byte streams with Range support.
+Every response is delayed by "latency" seconds, and every stream is sent at most at "bandwidth" bytes per second.
+
+Run it on its own with "python benchmarks/standin.py --port 8080", or use StandInServer from the benchmark runner.
+'''
+import json
+import hashlib
+import argparse
+from time import sleep, monotonic
+from threading import Thread, Lock
+from collections import Counter
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+YOUTUBE_HOSTS = ['youtube.com', 'www.youtube.com', 'm.youtube.com']
+STREAM_HOST = 'rr1---sn-standin.googlevideo.com'
+PLAYLIST_ID = 'PLstandin000000000000000000000000'
+CHANNEL_NAME = 'StandIn'
+PAGE_SIZE = 100
+BLOCK_SIZE = 65536
+JS_PATH = '/s/player/standin/player_ias.vflset/en_US/base.js'
+# Just enough of a player base.js for pytube's Cipher to parse. The streams are pre-signed, so it is never run.
+BASE_JS = '''var XY={AJ:function(a){a.reverse()}, VR:function(a,b){a.splice(0,b)}};
+Qx=function(a){a=a.split("");XY.AJ(a,15);XY.VR(a,3);return a.join("")};
+var Bpa=[Nf];
+function f(a,b,c,d){c&&d.set(b,encodeURIComponent(Qx(c)));a.C&&(b=a.get("n"))&&(b=Bpa[0](b),a.set("n",b))}
+Nf=function(a){var b=a.split(""),c=[function(d){d.reverse()},null,b];try{c[0](c[2])}catch(e){return"x"}return b.join("")};
+'''
+# itag: (resolution, share of the video size), progressive mp4 streams only
+FORMATS = {18 : ('360p', 0.5), 22 : ('720p', 1.0)}
+
+
+class StandInVideo:
+    '''A synthetic video, published "age" days ago.'''
+    def __init__(self, index: int, video_size: int) -> None:
+        self.video_id = f'standin{index:04d}'
+        self.title = f'Stand-in video {index}'
+        self.author = 'MyTube Stand-in'
+        self.publish_date = (datetime.today() - timedelta(days=index)).strftime('%Y-%m-%d')
+        self.keywords = ['standin', 'benchmark', ('even' if index % 2 == 0 else 'odd')]
+        self.sizes = {itag : int(video_size * share) for itag, (res, share) in FORMATS.items()}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self, send_body: bool = True):
+        parts = urlsplit(self.path)
+        query = {key : values[0] for key, values in parse_qs(parts.query).items()}
+        body = b''
+        if self.headers.get('Content-Length'):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+
+        routes = [
+            ('/watch', self._watch_page),
+            ('/youtubei/v1/player', self._player),
+            ('/youtubei/v1/browse', self._browse),
+            ('/playlist', self._playlist_page),
+            (f'/c/{CHANNEL_NAME}/videos', self._channel_page),
+            (f'/c/{CHANNEL_NAME}/playlists', self._channel_playlists_page),
+            (JS_PATH, self._base_js),
+            ('/videoplayback', self._stream)
+            ]
+        for path, handler in routes:
+            if parts.path == path:
+                self.server.count(path)
+                sleep(self.server.latency)
+                handler(query, body, send_body)
+                return
+        self.server.count('not found')
+        self._send(404, b'Not found', 'text/plain', send_body)
+
+    def _send(self, status: int, content: bytes, content_type: str, send_body: bool = True):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(content)
+
+    def _send_json(self, data: dict, send_body: bool = True):
+        self._send(200, json.dumps(data).encode(), 'application/json', send_body)
+
+    def _send_html(self, html: str, send_body: bool = True):
+        self._send(200, html.encode(), 'text/html; charset=utf-8', send_body)
+
+    def _video(self, video_id: str):
+        return self.server.videos.get(video_id)
+
+    def _watch_page(self, query: dict, body: bytes, send_body: bool):
+        video = self._video(query.get('v', ''))
+        if video is None:
+            player_response = {'playabilityStatus' : {'status' : 'ERROR', 'reason' : 'Video unavailable'}}
+            publish_date = ''
+        else:
+            player_response = {'playabilityStatus' : {'status' : 'OK'}, 'assets' : {'js' : JS_PATH}}
+            publish_date = f'<meta itemprop="datePublished" content="{video.publish_date}">'
+        self._send_html(
+            f'<html><head>{publish_date}</head><body>'
+            f'<script>var ytInitialPlayerResponse = {json.dumps(player_response)};</script>'
+            '</body></html>',
+            send_body
+            )
+
+    def _player(self, query: dict, body: bytes, send_body: bool):
+        video = self._video(query.get('videoId', ''))
+        if video is None:
+            self._send_json({'playabilityStatus' : {'status' : 'ERROR', 'reason' : 'Video unavailable'}}, send_body)
+            return
+
+        formats = []
+        for itag, (res, share) in FORMATS.items():
+            formats.append({
+                'itag' : itag,
+                'url' : f'https://{STREAM_HOST}/videoplayback?id={video.video_id}&itag={itag}&sig=standin',
+                'mimeType' : 'video/mp4; codecs="avc1.42001E, mp4a.40.2"',
+                'bitrate' : video.sizes[itag] * 8 // 60,
+                'contentLength' : str(video.sizes[itag]),
+                'qualityLabel' : res
+                })
+        self._send_json({
+            'playabilityStatus' : {'status' : 'OK'},
+            'videoDetails' : {
+                'videoId' : video.video_id,
+                'title' : video.title,
+                'author' : video.author,
+                'keywords' : video.keywords,
+                'lengthSeconds' : '60',
+                'viewCount' : '0',
+                'channelId' : f'UC{CHANNEL_NAME}',
+                'shortDescription' : ''
+                },
+            'streamingData' : {'formats' : formats}
+            }, send_body)
+
+    def _items(self, kind: str, start: int):
+        '''Returns a page of playlist, channel or channel playlists items, ending in a continuation if there are more.'''
+        if kind == 'playlists':
+            count = self.server.channel_playlists
+            items = [
+                {'gridPlaylistRenderer' : {'playlistId' : playlist_id, 'title' : {'simpleText' : title}}} 
+                for playlist_id, title in self.server.playlists()[start:min(start + PAGE_SIZE, count)]
+                ]
+        else:
+            renderer = 'playlistVideoRenderer' if kind == 'playlist' else 'gridVideoRenderer'
+            count = self.server.playlist_length if kind == 'playlist' else len(self.server.videos)
+            video_ids = list(self.server.videos)[start:min(start + PAGE_SIZE, count)]
+            items = [{renderer : {'videoId' : video_id}} for video_id in video_ids]
+        if start + PAGE_SIZE < count:
+            token = f'{kind}:{start + PAGE_SIZE}'
+            items.append({'continuationItemRenderer' : {'continuationEndpoint' : {'continuationCommand' : {'token' : token}}}})
+        return items
+
+    def _initial_data_page(self, initial_data: dict, send_body: bool):
+        self._send_html(
+            '<html><body>'
+            '<script>ytcfg.set({"INNERTUBE_API_KEY": "standin"});</script>'
+            f'<script>var ytInitialData = {json.dumps(initial_data)};</script>'
+            '</body></html>',
+            send_body
+            )
+
+    def _playlist_page(self, query: dict, body: bytes, send_body: bool):
+        if query.get('list') != PLAYLIST_ID:
+            self._send_html('<html><body></body></html>', send_body)
+            return
+        playlist = {'playlistVideoListRenderer' : {'contents' : self._items('playlist', 0)}}
+        self._initial_data_page({
+            'contents' : {'twoColumnBrowseResultsRenderer' : {'tabs' : [
+                {'tabRenderer' : {'content' : {'sectionListRenderer' : {'contents' : [{'itemSectionRenderer' : {'contents' : [playlist]}}]}}}}
+                ]}},
+            'sidebar' : {'playlistSidebarRenderer' : {'items' : [
+                {'playlistSidebarPrimaryInfoRenderer' : {'title' : {'runs' : [{'text' : 'Stand-in playlist'}]}}}
+                ]}}
+            }, send_body)
+
+    def _channel_page(self, query: dict, body: bytes, send_body: bool):
+        grid = {'gridRenderer' : {'items' : self._items('channel', 0)}}
+        videos_tab = {'tabRenderer' : {'content' : {'sectionListRenderer' : {'contents' : [{'itemSectionRenderer' : {'contents' : [grid]}}]}}}}
+        self._initial_data_page({
+            'contents' : {'twoColumnBrowseResultsRenderer' : {'tabs' : [{'tabRenderer' : {}}, videos_tab]}},
+            'metadata' : {'channelMetadataRenderer' : {'title' : CHANNEL_NAME, 'externalId' : f'UC{CHANNEL_NAME}'}}
+            }, send_body)
+
+    def _channel_playlists_page(self, query: dict, body: bytes, send_body: bool):
+        grid = {'gridRenderer' : {'items' : self._items('playlists', 0)}}
+        playlists_tab = {'tabRenderer' : {'content' : {'sectionListRenderer' : {'contents' : [{'itemSectionRenderer' : {'contents' : [grid]}}]}}}}
+        self._initial_data_page({
+            'contents' : {'twoColumnBrowseResultsRenderer' : {'tabs' : [{'tabRenderer' : {}}, {'tabRenderer' : {}}, playlists_tab]}},
+            'metadata' : {'channelMetadataRenderer' : {'title' : CHANNEL_NAME, 'externalId' : f'UC{CHANNEL_NAME}'}}
+            }, send_body)
+
+    def _browse(self, query: dict, body: bytes, send_body: bool):
+        kind, start = json.loads(body or b'{}').get('continuation', 'channel:0').split(':')
+        self._send_json({'onResponseReceivedActions' : [{'appendContinuationItemsAction' : {'continuationItems' : self._items(kind, int(start))}}]}, send_body)
+
+    def _base_js(self, query: dict, body: bytes, send_body: bool):
+        self._send(200, BASE_JS.encode(), 'text/javascript', send_body)
+
+    def _stream(self, query: dict, body: bytes, send_body: bool):
+        video = self._video(query.get('id', ''))
+        itag = int(query.get('itag', 0))
+        if video is None or itag not in video.sizes:
+            self._send(404, b'Not found', 'text/plain', send_body)
+            return
+
+        size = video.sizes[itag]
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range', '')
+        if range_header.startswith('bytes='):
+            first, last = range_header[len('bytes='):].split('-')
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if not send_body:
+            return
+
+        # The content of a stream only depends on its video ID and itag, so downloads can be checked
+        block = hashlib.sha256(f'{video.video_id}:{itag}'.encode()).digest() * (BLOCK_SIZE // 32)
+        started = monotonic()
+        position = start
+        while position <= end:
+            offset = position % BLOCK_SIZE
+            piece = block[offset:offset + min(BLOCK_SIZE - offset, end - position + 1)]
+            self.wfile.write(piece)
+            position += len(piece)
+            self.server.count_bytes(len(piece))
+            if self.server.bandwidth:
+                ahead = (position - start) / self.server.bandwidth - (monotonic() - started)
+                if ahead > 0:
+                    sleep(ahead)
+
+
+class StandInServer(ThreadingHTTPServer):
+    '''
+    The stand-in server, on a thread of its own once started.
+    "videos" synthetic videos make up the channel, newest first, and the first "playlist_length" of them the playlist.
+    The channel lists "channel_playlists" playlists, the first of them being that playlist.
+    '''
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0, bandwidth: float = 0, videos: int = 250, playlist_length: int = 10, video_size: int = 4194304, channel_playlists: int = 150) -> None:
+        super().__init__(('127.0.0.1', port), StandInHandler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.video_size = video_size
+        self.playlist_length = min(playlist_length, videos)
+        self.channel_playlists = max(channel_playlists, 1)
+        self.videos = {}
+        for index in range(videos):
+            video = StandInVideo(index, video_size)
+            self.videos[video.video_id] = video
+        self.lock = Lock()
+        self.requests = Counter()
+        self.bytes_sent = 0
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    @property
+    def playlist_url(self):
+        return f'https://www.youtube.com/playlist?list={PLAYLIST_ID}'
+
+    def video_url(self, index: int):
+        return f'https://www.youtube.com/watch?v={list(self.videos)[index]}'
+
+    def playlists(self):
+        '''Returns the (playlist ID, title) of every playlist of the channel. Only the first one has a playlist page.'''
+        return [(PLAYLIST_ID, 'Stand-in playlist')] + [
+            (f'PLstandin{index:024d}', f'Stand-in playlist {index}') for index in range(1, self.channel_playlists)
+            ]
+
+    def count(self, path: str):
+        with self.lock:
+            self.requests[path] += 1
+
+    def count_bytes(self, size: int):
+        with self.lock:
+            self.bytes_sent += size
+
+    def stats(self):
+        '''Returns the requests per path and the stream bytes sent since the last call.'''
+        with self.lock:
+            stats = {'requests' : dict(self.requests), 'stream_bytes' : self.bytes_sent}
+            self.requests.clear()
+            self.bytes_sent = 0
+        return stats
+
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for YouTube, for benchmarking MyTube without network access.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every response')
+    parser.add_argument('--bandwidth', type=float, default=0, help='bytes per second per stream, 0 = unlimited')
+    parser.add_argument('--videos', type=int, default=250)
+    parser.add_argument('--video-size', type=int, default=4194304, help='bytes of the 720p stream of a video')
+    args = parser.parse_args()
+
+    server = StandInServer(args.port, args.latency, args.bandwidth, args.videos, video_size=args.video_size)
+    print(f'Serving {", ".join(YOUTUBE_HOSTS + [STREAM_HOST])} on {server.base_url}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
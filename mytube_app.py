@@ -1,23 +1,46 @@
-import re
+from time import perf_counter
+STARTUP_STARTED = perf_counter()
+
 import os
 import sys
+import json
 import webbrowser
-from time import sleep
-from threading import Thread
-from datetime import datetime
-from pathlib import Path
-from difflib import SequenceMatcher
+from threading import Thread, Event
+from queue import SimpleQueue, Empty
 from urllib.error import HTTPError
 import tkinter as tk
 from tkinter import ttk, messagebox
-from tkinter.filedialog import askdirectory
-
-import helium
-from bs4 import BeautifulSoup
-from pytube import Playlist, YouTube, Channel, request, exceptions
+from tkinter.filedialog import askdirectory, askopenfilename
+
+from pytube import Playlist, exceptions
+
+from mytube_core import (
+    DEFAULT_DOWNLOAD_WORKERS, 
+    MAX_DOWNLOAD_WORKERS, 
+    MAX_CONNECTIONS_PER_VIDEO, 
+    TIMEFRAME_OPTIONS, 
+    THROTTLE, 
+    JOB_PRIORITY_VIDEO, 
+    Resolution, 
+    Validate, 
+    BatchDownloader, 
+    JobQueue, 
+    ProgressReporter, 
+    DownloadCancelled, 
+    DownloadInterrupted, 
+    MyTubeError, 
+    InvalidChannelError, 
+    InvalidPlaylistError, 
+    NoVideosFoundError, 
+    InvalidKeywordsError, 
+    PlaylistCatalog, 
+    VideoEnumerator, 
+    VideoList, 
+    PROFILER
+    )
 
 # PyInstaller command for extraction purposes:
-# pyinstaller --onefile --noconsole -n "MyTube" --icon "icon.ico" --add-data "icon.ico;." --collect-all "helium"  mytube_app.py
+# pyinstaller --onefile --noconsole -n "MyTube" --icon "icon.ico" --add-data "icon.ico;."  mytube_app.py
 
 WINDOW_HEIGHT = 300
 WINDOW_WIDTH = 500
@@ -27,6 +50,9 @@ ENTRY_WIDTH = 40
 DOWNLOAD_BUTTON_COLOR = 'lightgray'
 DOWNLOAD_BUTTON_WIDTH = 18
 DOWNLOAD_BUTTON_HEIGHT = 1
+PROGRESS_REFRESH_MS = 100
+# Set once the main window is closed, so the downloads still running stay queued to be resumed
+APP_CLOSING = Event()
 
 def resource_path(relative_path: str):
         """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -40,24 +66,6 @@ def resource_path(relative_path: str):
 
         return os.path.join(base_path, relative_path)
 
-class Resolution:
-    def __init__(self) -> None:
-        self.options = [
-            '144p',
-            '360p',
-            '480p',
-            '720p'
-            ]        
-        self.default_res = self.options[3]
-
-    
-    def downgrade(self, current_resolution: str):
-        next_resolution_index = self.options.index(current_resolution) - 1
-        if next_resolution_index == -1:
-            return None
-        return self.options[next_resolution_index]
-
-
 class App:
     def __init__(self, root) -> None:
         self.root = root
@@ -92,15 +100,26 @@ class OptionsTab:
     def __init__(self, app: App) -> None:
         self.frame = app.tabs.get('Options')
         self.messages = Messages()
-        self.root = root
+        self.root = app.root
         self.res_elements = {}
         self.dir_elements = {}
+        self.workers_elements = {}
+        self.connections_elements = {}
+        self.max_speed_elements = {}
+        self.max_requests_elements = {}
         self.stringvars = {
             'resolution' : tk.StringVar(),
-            'directory' : tk.StringVar()
+            'directory' : tk.StringVar(),
+            'workers' : tk.StringVar(),
+            'connections' : tk.StringVar(),
+            'max speed' : tk.StringVar(),
+            'max requests' : tk.StringVar()
         }
         self._generate_resolution_elements()
         self._generate_save_dir_elements()
+        self._generate_workers_elements()
+        self._generate_connections_elements()
+        self._generate_limit_elements()
         self._build()
 
     def _browse_dir(self):
@@ -118,14 +137,51 @@ class OptionsTab:
         self.dir_elements['field'] = tk.Entry(self.frame, textvariable=self.stringvars.get('directory'), width=ENTRY_WIDTH)
         self.dir_elements['button'] = tk.Button(self.frame, text='Browse', command=self._browse_dir, width=10)
 
+    def _generate_workers_elements(self):
+        self.stringvars['workers'].set(str(DEFAULT_DOWNLOAD_WORKERS))
+        self.workers_elements['label'] = tk.Label(self.frame, text='Simultaneous downloads', width=LABEL_WIDTH)
+        self.workers_elements['spinbox'] = tk.Spinbox(self.frame, from_=1, to=MAX_DOWNLOAD_WORKERS, textvariable=self.stringvars.get('workers'), width=5, state='readonly')
+
+    def _generate_connections_elements(self):
+        self.stringvars['connections'].set('1')
+        self.connections_elements['label'] = tk.Label(self.frame, text='Connections per video', width=LABEL_WIDTH)
+        self.connections_elements['spinbox'] = tk.Spinbox(self.frame, from_=1, to=MAX_CONNECTIONS_PER_VIDEO, textvariable=self.stringvars.get('connections'), width=5, state='readonly')
+
+    def _generate_limit_elements(self):
+        self.stringvars['max speed'].set('0')
+        self.stringvars['max requests'].set('0')
+        self.max_speed_elements['label'] = tk.Label(self.frame, text='Max speed (KB/s)', width=LABEL_WIDTH)
+        self.max_speed_elements['spinbox'] = tk.Spinbox(self.frame, from_=0, to=100_000, increment=100, textvariable=self.stringvars.get('max speed'), width=7)
+        self.max_speed_elements['hint'] = tk.Label(self.frame, text='0 = unlimited')
+        self.max_requests_elements['label'] = tk.Label(self.frame, text='Max requests/s', width=LABEL_WIDTH)
+        self.max_requests_elements['spinbox'] = tk.Spinbox(self.frame, from_=0, to=100, textvariable=self.stringvars.get('max requests'), width=7)
+        self.max_requests_elements['hint'] = tk.Label(self.frame, text='0 = unlimited')
+        # The limits apply to the downloads already running as well
+        self.stringvars['max speed'].trace_add('write', self._apply_limits)
+        self.stringvars['max requests'].trace_add('write', self._apply_limits)
+
     def _build(self):
-        self.res_elements['label'].grid(column=0, row=1, sticky=tk.W, padx=10, pady=15)
+        self.res_elements['label'].grid(column=0, row=1, sticky=tk.W, padx=10, pady=8)
         self.res_elements['button'].grid(column=1, row=1, sticky=tk.W)
 
-        self.dir_elements['label'].grid(column=0, row=2, sticky=tk.W, padx=10, pady=15)
+        self.dir_elements['label'].grid(column=0, row=2, sticky=tk.W, padx=10, pady=8)
         self.dir_elements['field'].grid(column=1, row=2, sticky=tk.W)
         self.dir_elements['button'].grid(column=2, row=2, sticky=tk.W, padx=5)
 
+        self.workers_elements['label'].grid(column=0, row=3, sticky=tk.W, padx=10, pady=8)
+        self.workers_elements['spinbox'].grid(column=1, row=3, sticky=tk.W)
+
+        self.connections_elements['label'].grid(column=0, row=4, sticky=tk.W, padx=10, pady=8)
+        self.connections_elements['spinbox'].grid(column=1, row=4, sticky=tk.W)
+
+        self.max_speed_elements['label'].grid(column=0, row=5, sticky=tk.W, padx=10, pady=8)
+        self.max_speed_elements['spinbox'].grid(column=1, row=5, sticky=tk.W)
+        self.max_speed_elements['hint'].grid(column=1, row=5, sticky=tk.E)
+
+        self.max_requests_elements['label'].grid(column=0, row=6, sticky=tk.W, padx=10, pady=8)
+        self.max_requests_elements['spinbox'].grid(column=1, row=6, sticky=tk.W)
+        self.max_requests_elements['hint'].grid(column=1, row=6, sticky=tk.E)
+
     def get_resolution(self):
         return self.stringvars.get('resolution').get()
     
@@ -135,6 +191,48 @@ class OptionsTab:
             self.messages.invalid_save_dir()
             return
         return save_dir
+
+    def get_workers(self):
+        '''Returns the number of videos to download at the same time.'''
+        try:
+            workers = int(self.stringvars.get('workers').get())
+        except ValueError:
+            return DEFAULT_DOWNLOAD_WORKERS
+        return min(max(workers, 1), MAX_DOWNLOAD_WORKERS)
+
+    def get_connections(self):
+        '''Returns the number of connections each video is downloaded with. 1 means segmented downloads are off.'''
+        try:
+            connections = int(self.stringvars.get('connections').get())
+        except ValueError:
+            return 1
+        return min(max(connections, 1), MAX_CONNECTIONS_PER_VIDEO)
+
+    def _get_limit(self, name: str):
+        try:
+            return max(float(self.stringvars.get(name).get()), 0)
+        except ValueError:
+            return 0
+
+    def _apply_limits(self, *args):
+        '''Sets the process-wide speed and request rate limits from the spinboxes. Anything not a number means unlimited.'''
+        THROTTLE.set_limits(
+            bytes_per_second=self._get_limit('max speed') * 1024,
+            requests_per_second=self._get_limit('max requests')
+            )
+
+    def get_batch_downloader(self, progress_bar: 'ProgressBar'):
+        '''Returns a BatchDownloader using the current options, or None if the save directory is invalid.'''
+        save_dir = self.get_save_dir()
+        if save_dir is None:
+            return None
+        return BatchDownloader(
+            save_dir=save_dir,
+            resolution=self.get_resolution(),
+            workers=self.get_workers(),
+            connections=self.get_connections(),
+            progress=progress_bar
+            )
         
    
 class VideoTab:
@@ -144,9 +242,8 @@ class VideoTab:
         self.options = options
         self.validate = Validate()
         self.messages = Messages()
-        self.url = ''
-        self.output_filename = None
         self.dl_button = None
+        self.list_button = None
         self.url_elements = {}
         self.rename_file_elements = {}
         self.stringvars = {
@@ -168,11 +265,19 @@ class VideoTab:
 
     def _generate_download_button(self):
         self.dl_button = tk.Button(self.frame, text='DOWNLOAD', bg=DOWNLOAD_BUTTON_COLOR, height=DOWNLOAD_BUTTON_HEIGHT, width=DOWNLOAD_BUTTON_WIDTH, command=self._start_video_download)
+        self.list_button = tk.Button(self.frame, text='DOWNLOAD LIST...', height=DOWNLOAD_BUTTON_HEIGHT, width=DOWNLOAD_BUTTON_WIDTH, command=self._open_video_list)
 
     def _start_video_download(self):
         thread = Thread(target=self.download)
         thread.start()
 
+    def _open_video_list(self):
+        VideoListDialog(self.root, self._start_video_list_download)
+
+    def _start_video_list_download(self, videos: VideoList):
+        thread = Thread(target=self.download_list, args=(videos,))
+        thread.start()
+
     def _build(self):
         self.url_elements.get('label').grid(column=0, row=0, sticky=tk.W, padx=10, pady=15)
         self.url_elements.get('field').grid(column=1, row=0, sticky=tk.W)
@@ -181,36 +286,106 @@ class VideoTab:
         self.rename_file_elements.get('field').grid(column=1, row=1, sticky=tk.W)
         
         self.dl_button.grid(column=1, row=2, pady=10)
+        self.list_button.grid(column=1, row=3)
 
     def download(self):
         progress_bar = ProgressBar(self.root)
-        filename = self.stringvars['filename'].get()        
-        downloader = VideoDownloader(
-            url=self.stringvars['url'].get(), 
-            save_directory=self.validate.validate_save_directory(self.options.get_save_dir(), []),
-            resolution=self.options.get_resolution(),
-            )
-        progress_bar.update_status_downloading(0, 1)
-        downloader.set_progress_bar(progress_bar)
-        downloader.set_output_filename(filename)
-        downloader.add_resolution_prefix()
+        downloader = self.options.get_batch_downloader(progress_bar)
+        if downloader is None:
+            progress_bar.kill()
+            return
+
+        url = self.stringvars['url'].get()
+        filenames = {}
+        if self.stringvars['filename'].get().strip() != '':
+            filenames[url] = self.stringvars['filename'].get()
         try:
-            downloader.download_video()
+            # Queued ahead of any channel or playlist downloads running at the same time
+            result = downloader.download_urls([url], title=url, priority=JOB_PRIORITY_VIDEO, filenames=filenames)
         except exceptions.RegexMatchError:
             progress_bar.kill()
             self.messages.invalid_video_url()
             return 
-        except RuntimeError:
+        progress_bar.kill()
+        if result.stopped:
+            self.messages.download_stopped()
+            return
+        if result.failed:
+            self.messages.connection_error()
+            return
+        self.messages.download_complete()
+
+    def download_list(self, videos: VideoList):
+        '''Downloads every video of the list in one batch, and sums up the outcome in a single message.'''
+        progress_bar = ProgressBar(self.root)
+        downloader = self.options.get_batch_downloader(progress_bar)
+        if downloader is None:
             progress_bar.kill()
             return
+
+        try:
+            result = downloader.download_video_list(videos)
+        except NoVideosFoundError:
+            progress_bar.kill()
+            self.messages.invalid_video_list()
+            return
         progress_bar.kill()
-        self.messages.download_complete()
+        self.messages.video_list_summary(
+            len(result.downloaded), len(result.skipped), [url for url, error in result.failed], 
+            len(videos.invalid), videos.duplicates, result.stopped
+            )
+
+
+class VideoListDialog:
+    '''
+    Window to paste a list of video URLs into, or to load one from a text or CSV file. 
+    One URL per line, optionally followed by a comma and the file name to save the video as.
+    '''
+    def __init__(self, root: tk.Tk, on_download) -> None:
+        self.on_download = on_download
+        self.top = tk.Toplevel(root)
+        self.top.title('Video list')
+        self.elements = {}
+        self.elements['label'] = tk.Label(self.top, text='One video URL per line, optionally followed by a comma and a file name')
+        self.elements['text'] = tk.Text(self.top, width=60, height=12)
+        self.elements['open button'] = tk.Button(self.top, text='Open file...', width=DOWNLOAD_BUTTON_WIDTH, command=self._open_file)
+        self.elements['download button'] = tk.Button(self.top, text='DOWNLOAD', bg=DOWNLOAD_BUTTON_COLOR, height=DOWNLOAD_BUTTON_HEIGHT, width=DOWNLOAD_BUTTON_WIDTH, command=self._download)
+        self._build()
+        self.top.iconbitmap(resource_path('icon.ico'))
+
+    def _build(self):
+        self.elements['label'].grid(column=0, row=0, columnspan=2, sticky=tk.W, padx=10, pady=10)
+        self.elements['text'].grid(column=0, row=1, columnspan=2, padx=10)
+        self.elements['open button'].grid(column=0, row=2, pady=10)
+        self.elements['download button'].grid(column=1, row=2, pady=10)
+
+    def _open_file(self):
+        path = askopenfilename(parent=self.top, filetypes=[('URL lists', '*.txt *.csv'), ('All files', '*.*')])
+        if not path:
+            return
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as file:
+                text = file.read()
+        except (OSError, UnicodeDecodeError):
+            Messages().invalid_video_list()
+            return
+        self.elements['text'].delete('1.0', tk.END)
+        self.elements['text'].insert('1.0', text)
+
+    def _download(self):
+        videos = VideoList(self.elements['text'].get('1.0', tk.END))
+        if len(videos.entries) == 0:
+            Messages().invalid_video_list()
+            return
+        self.top.destroy()
+        self.on_download(videos)
 
 
 class ChannelTab:
     def __init__(self, app: App, options: OptionsTab) -> None:
         self.frame = app.tabs.get('Channel')
         self.root = app.root
+        self.options = options
         self.validate = Validate()
         self.messages = Messages()
         self.output_filename = None
@@ -224,13 +399,8 @@ class ChannelTab:
             'timeframe' : tk.StringVar(),
             'keywords' : tk.StringVar()
             }
-        self.timeframe_options = {
-            'Day' : 1,
-            'Week' : 7,
-            'Month' : 31,
-            'Year' : 365,
-            'All Time' : 10_000
-            }
+        self.incremental = tk.BooleanVar()
+        self.timeframe_options = TIMEFRAME_OPTIONS
         
         self._generate_download_button()
         self._generate_channel_name_elements()
@@ -250,6 +420,8 @@ class ChannelTab:
         self.timeframe_elements['label'] = tk.Label(self.frame, text='Within the past', width=LABEL_WIDTH)
         self.stringvars['timeframe'].set('All Time')
         self.timeframe_elements['menu'] = tk.OptionMenu(self.frame, self.stringvars['timeframe'], *self.timeframe_options)
+        # Only look at videos newer than the newest one downloaded from the channel last time
+        self.timeframe_elements['incremental'] = tk.Checkbutton(self.frame, text='New only', variable=self.incremental)
 
     def _generate_download_button(self):
         self.dl_button = tk.Button(self.frame, text='DOWNLOAD', bg=DOWNLOAD_BUTTON_COLOR, height=DOWNLOAD_BUTTON_HEIGHT, width=DOWNLOAD_BUTTON_WIDTH, command=self._start_channel_download)
@@ -266,72 +438,13 @@ class ChannelTab:
 
         self.timeframe_elements['label'].grid(column=0, row=3, sticky=tk.EW, padx=10, pady=20)
         self.timeframe_elements['menu'].grid(column=1, row=3)
+        self.timeframe_elements['incremental'].grid(column=2, row=3, sticky=tk.W)
 
         self.keyword_elements['label'].grid(column=0, row=4, sticky=tk.EW, padx=10, pady=20)
         self.keyword_elements['field'].grid(column=1, row=4)
 
         self.dl_button.grid(column=1, row=5, pady=20, padx=10, sticky=tk.EW)
 
-    def video_within_timeframe(self, video: YouTube):
-        '''
-        Returns True if video has been publishing within the given timeframe.
-        Always returns True if the given timeframe is "All Time".
-        '''
-        if self.stringvars['timeframe'].get() == 'All Time':
-            return True
-
-        days_since_upload = (datetime.today() - video.publish_date).days
-        if days_since_upload <= self.timeframe_options[self.stringvars['timeframe'].get()]:
-            return True
-        else:
-            return False      
-
-    def video_match_keywords(self, video: YouTube):
-        '''Returns True if any keyword given by the user, matches the keywords set by the video'''
-        user_keywords = self.stringvars['keywords'].get().split(',')
-
-        # Default, no keywords
-        if len(user_keywords) == 0:
-            return True
-        
-        for video_keyword in video.keywords:
-            for user_keyword in user_keywords:
-                user_keyword = user_keyword.strip().lower()
-                video_keyword = video_keyword.strip().lower()
-                video_title = video.title.lower()
-
-                user_keyword_in_video_title = re.search(re.compile(fr'{user_keyword}'), video_title)
-
-                if user_keyword == video_keyword or user_keyword_in_video_title is not None:
-                    return True
-        
-        return False
-
-    def filter_channel_videos(self, channel: Channel):
-        '''
-        Return a list of YouTube object which, 
-        matches any timeframe,  
-        and contains the keywords given, if any.
-
-        Keyword searches returns True if
-        keyword is found in the keywords given by the author, 
-        or in the the video title.
-
-        Since video keywords may contain sentences, 
-        keywords given by the user will only be seperated by commas (,). 
-        '''
-
-        macthing_videos = []
-        for video in channel.videos:
-            if self.video_within_timeframe(video):
-                if self.video_match_keywords(video):
-                    macthing_videos.append(video) 
-            else:
-                # the channel.videos list is ordered by newest first, 
-                # so if timeframe does not match once, the following won't match either.
-                break 
-        return macthing_videos
-
     def download_channel(self):
         '''
         Primary method of this class.
@@ -342,55 +455,58 @@ class ChannelTab:
             self.messages.invalid_channel_name()
             progress_bar.kill()
             return
-        progress_bar.update_status('Searching for channel')
-        channel_name = self.validate.validate_channel_name(self.stringvars['channel name'].get())
-        channel = Channel(f"https://www.youtube.com/c/{channel_name}")
+        downloader = self.options.get_batch_downloader(progress_bar)
+        if downloader is None:
+            progress_bar.kill()
+            return
 
         try:
-            if len(channel.videos) == 0:
-                self.messages.invalid_channel_name()
-                progress_bar.kill()
-                return
+            result = downloader.download_channel(
+                self.stringvars['channel name'].get(),
+                timeframe=self.stringvars['timeframe'].get(),
+                keywords=self.stringvars['keywords'].get(),
+                incremental=self.incremental.get()
+                )
+        except InvalidChannelError:
+            self.messages.invalid_channel_name()
+            progress_bar.kill()
+            return
         except HTTPError:
             self.messages.connection_error()
             progress_bar.kill()
             return 
-
-        progress_bar.update_status('Looking for videos')
-        filtered_videos = self.filter_channel_videos(channel)
-        if len(filtered_videos) == 0:
+        except NoVideosFoundError:
             progress_bar.kill()
             self.messages.no_videos_found()
             return 
+        except InvalidKeywordsError as error:
+            progress_bar.kill()
+            self.messages.invalid_keywords(str(error))
+            return 
+        except DownloadCancelled:
+            # Progress window closed while looking for videos
+            progress_bar.kill()
+            self.messages.download_stopped()
+            return
 
-        for index, video in enumerate(filtered_videos):
-            progress_bar.update_status_downloading(index, len(filtered_videos))
-            downloader = VideoDownloader(
-                url=video.watch_url, 
-                resolution=options.get_resolution(), 
-                save_directory=self.validate.validate_save_directory(options.get_save_dir(), [video.author])
-                )
-            downloader.set_progress_bar(progress_bar)
-            downloader.add_resolution_prefix()
-            try:
-                downloader.download_video()
-            except RuntimeError:
-                progress_bar.kill()
-                return
-        
         progress_bar.kill()
+        if result.stopped:
+            self.messages.download_stopped()
+            return
         self.messages.download_complete()
 
 
 class PlaylistTab:
     def __init__(self, app: App, options: OptionsTab) -> None:
         self.root = app.root
+        self.options = options
         self.url_frame = tk.Frame(app.tabs.get('Playlist'), width=WINDOW_WIDTH, height=WINDOW_HEIGHT/2)
         self.playlist_frame = tk.Frame(app.tabs.get('Playlist'), width=WINDOW_WIDTH, height=WINDOW_HEIGHT/2)
         self.validate = Validate() 
         self.messages = Messages()
         self.output_filename = None
         self.temp_playlist_data = []
+        self.playlist_catalog = PlaylistCatalog()
         self.url_elements = {}
         self.channel_elements = {}
         self.playlist_elements = {}
@@ -448,9 +564,6 @@ class PlaylistTab:
         elif self.stringvars['playlist name'] == '':
             self.messages.invalid_playlist_name()
             return 
-        user_accept = self.messages.process_time_warning()
-        if not user_accept:
-            return
         thread = Thread(target=self.download_channel_playlist)
         thread.start()
 
@@ -470,19 +583,6 @@ class PlaylistTab:
         self.playlist_elements['field'].grid(column=1, row=1, sticky=tk.W)
         self.playlist_elements['button'].grid(column=1, row=2, pady=10)
 
-    def _get_playlist_data(self):
-        url = f"https://www.youtube.com/c/{self.stringvars['channel name'].get()}/playlists"
-        playlist_data = []
-        with helium.start_firefox(url, headless=True) as browser:
-            if browser.current_url.startswith('https://consent.youtube.com'):
-                helium.press(helium.PAGE_DOWN)
-                helium.click(helium.Button("I agree"))
-            sleep(10)
-            soup = BeautifulSoup(browser.page_source, 'html.parser')
-            for a_tag in soup.find_all('a', id='video-title'):
-                playlist_data.append([a_tag.attrs['title'], a_tag.attrs['href']])
-        return playlist_data
-
     def _generate_playlists(self):
         playlists = []
         for a_tag in self.a_tags:
@@ -491,93 +591,90 @@ class PlaylistTab:
 
         return playlists
 
-    def _similar(self, a: str, b: str):
-        '''Returns a float percentage of how similiar two strings are.'''
-        return SequenceMatcher(None, a, b).quick_ratio()
-
-    def _suggest_playlist(self, playlist: Playlist):
+    def _suggest_playlist(self, title: str):
         '''Suggest a playlist to user.'''
-        return self.messages.suggest_playlist(playlist)
+        return self.messages.suggest_playlist(title)
 
     def find_playlist(self):
         '''Returns the Playlist object of it matches the playlist name, the user is looking for.'''
         playlist_name = self.stringvars['playlist name'].get()
-        playlist_data = self._get_playlist_data()
-
-        for playlist in playlist_data:
-            title = playlist[0]
-            href = playlist[1]
-            if playlist_name.lower() == title.lower():
-                return Playlist(href) 
-        else:
-            # if no 100% match, look for 85%+ matches
-            for playlist in playlist_data:
-                title = playlist[0]
-                href = playlist[1]
-                if self._similar(playlist_name.lower(), title.lower()) >= 0.85:
-                    playlist = Playlist(href)
-                    accept_suggestion = self._suggest_playlist(playlist)
-                    if accept_suggestion:
-                        return playlist
-            self.messages.channel_playlist_not_found()
-            return None
+        try:
+            matches = self.playlist_catalog.search(self.stringvars['channel name'].get(), playlist_name)
+        except HTTPError as error:
+            if error.code != 404:
+                self.messages.connection_error()
+                return None
+            # No such channel
+            matches = []
+
+        for match in matches:
+            if playlist_name.lower() == match.title.lower():
+                return Playlist(match.url)
+        # if no 100% match, suggest the closest matches, best first
+        for match in matches:
+            if self._suggest_playlist(match.title):
+                return Playlist(match.url)
+        self.messages.channel_playlist_not_found()
+        return None
 
     def download_playlist(self):
         progress_bar = ProgressBar(self.root)
-        progress_bar.update_status('Searching for playlist')
-        playlist = Playlist(self.stringvars['url'].get())
+        downloader = self.options.get_batch_downloader(progress_bar)
+        if downloader is None:
+            progress_bar.kill()
+            return
 
-        progress_bar.update_status('Finding videos in playlist')
-        if len(playlist.videos) == 0 or playlist._html is None:
+        try:
+            result = downloader.download_playlist(self.stringvars['url'].get())
+        except InvalidPlaylistError:
             self.messages.invalid_playlist_url()
             progress_bar.kill()
             return
-
-        for index, video in enumerate(playlist.videos):
-            progress_bar.update_status_downloading(index, len(playlist.videos))
-            downloader = VideoDownloader(
-                url=video.watch_url, 
-                resolution=options.get_resolution(), 
-                save_directory=self.validate.validate_save_directory(options.get_save_dir(), [video.author, playlist.title])
-                )
-            downloader.set_progress_bar(progress_bar)
-            downloader.add_resolution_prefix()
-            try:
-                downloader.download_video()
-            except RuntimeError:
-                progress_bar.kill()
-                return
+        except DownloadCancelled:
+            progress_bar.kill()
+            self.messages.download_stopped()
+            return
+        except (MyTubeError, exceptions.PytubeError, HTTPError):
+            progress_bar.kill()
+            self.messages.connection_error()
+            return
 
         progress_bar.kill()
+        if result.stopped:
+            self.messages.download_stopped()
+            return
         self.messages.download_complete()
     
+    @PROFILER.profiled
     def download_channel_playlist(self):
         progress_bar = ProgressBar(self.root)
-        progress_bar.update_status('Searching for playlist')
-        relevant_playlist = self.find_playlist()
-        
-        progress_bar.update_status('Finding videos in playlist')
-        if relevant_playlist is None:
-            # Either wrong channel name or channel has no playlists
-            progress_bar.kill()
-            return
-        
-        for index, video in enumerate(relevant_playlist.videos):
-            progress_bar.update_status_downloading(index, len(relevant_playlist.videos))
-            downloader = VideoDownloader(
-                url=video.watch_url, 
-                resolution=options.get_resolution(), 
-                save_directory=self.validate.validate_save_directory(options.get_save_dir(), [video.author])
-                )
-            downloader.set_progress_bar(progress_bar)
-            downloader.add_resolution_prefix()
-            try:
-                downloader.download_video()
-            except RuntimeError:
+        try:
+            progress_bar.update_status('Searching for playlist')
+            relevant_playlist = self.find_playlist()
+            
+            progress_bar.update_status('Finding videos in playlist')
+            if relevant_playlist is None:
+                # Either wrong channel name or channel has no playlists
                 progress_bar.kill()
                 return
-        
+            downloader = self.options.get_batch_downloader(progress_bar)
+            if downloader is None:
+                progress_bar.kill()
+                return
+            
+            result = downloader.download_urls(VideoEnumerator(relevant_playlist), [])
+        except DownloadCancelled:
+            progress_bar.kill()
+            self.messages.download_stopped()
+            return
+        except (MyTubeError, exceptions.PytubeError, HTTPError):
+            progress_bar.kill()
+            self.messages.connection_error()
+            return
         progress_bar.kill()
+        if result.stopped:
+            self.messages.download_stopped()
+            return
         self.messages.download_complete()
 
 
@@ -612,27 +709,49 @@ class AboutTab:
         self.elements['license'].bind('<Button-1>', lambda e: self._open_hyperlink("https://github.com/kristianhnielsen/MyTube/blob/main/LICENSE"))
 
 
-class ProgressBar:
+class ProgressBar(ProgressReporter):
+    '''
+    Progress window of a download.
+    The download threads never touch Tk, they only put events on a queue. 
+    The Tk thread drains it every PROGRESS_REFRESH_MS, applying only the latest event of each kind,
+    so the window costs the same however many downloads report to it, and however often.
+    '''
     def __init__(self, root: tk.Tk) -> None:
+        self.root = root
+        self.events = SimpleQueue()
+        self.cancelled = Event()
         self.top = tk.Toplevel(root)
         self.video_name = tk.StringVar()
         self.status = tk.StringVar()
+        self.pipeline = tk.StringVar()
         self.download_percentage = tk.StringVar()
         
         self._setup_window()
         self.bar = ttk.Progressbar(self.top, orient=tk.HORIZONTAL, length=100, mode='determinate')
         self.video_name_label = tk.Label(self.top, textvariable=self.video_name)
         self.status_label = tk.Label(self.top, textvariable=self.status)
+        self.pipeline_label = tk.Label(self.top, textvariable=self.pipeline)
         self.download_percentage_label = tk.Label(self.top, textvariable=self.download_percentage)
-        self.update_status('Getting ready...')
+        self.status.set('Getting ready...')
         self._update_download_percent(0.0)
         self.cancel_button = tk.Button(self.top, text='Cancel', command=self.top.destroy)
         self._build()
         self.top.iconbitmap(resource_path('icon.ico'))
+        # Closing the window in any way cancels the download
+        self.top.bind('<Destroy>', lambda event: self.cancelled.set())
+        self.handlers = {
+            'video name' : self.video_name.set,
+            'job slots' : self._resize,
+            'status' : self.status.set,
+            'pipeline' : self._update_pipeline,
+            'progress' : self._update_bar
+            }
+        self.root.after(PROGRESS_REFRESH_MS, self._drain)
     
     def _build(self):
         self.video_name_label.pack(expand=True, fill='both', pady=5, padx=10, anchor=tk.NW)
         self.status_label.pack(expand=True, fill='both', pady=5, padx=10, anchor=tk.N)
+        self.pipeline_label.pack(expand=True, fill='both', padx=10, anchor=tk.N)
         self.bar.pack(expand=True, pady=10, fill='both', padx=15)
         self.download_percentage_label.pack(expand=True, fill='both', pady=5, padx=10, anchor=tk.N)
         self.cancel_button.pack(expand=True, pady=15)
@@ -640,17 +759,59 @@ class ProgressBar:
     def _setup_window(self):
         self.top.title("Progress")
         self.window_width = 400
-        self.window_height = 200
+        self.window_height = 220
         self.top.geometry(f'{self.window_width}x{self.window_height}')
 
+    def _publish(self, kind: str, *args):
+        '''Called from the download threads. Queues the event for the Tk thread.'''
+        if self.cancelled.is_set():
+            if APP_CLOSING.is_set():
+                raise DownloadInterrupted('MyTube closed')
+            raise DownloadCancelled('Progress window closed')
+        self.events.put((kind, args))
+
+    def _drain(self):
+        '''Runs on the Tk thread. Applies the latest queued event of each kind, then schedules the next run.'''
+        latest = {}
+        while True:
+            try:
+                kind, args = self.events.get_nowait()
+            except Empty:
+                break
+            latest[kind] = args
+        if 'kill' in latest or self.cancelled.is_set():
+            self.top.destroy()
+            return
+        for kind, args in latest.items():
+            self.handlers[kind](*args)
+        self.root.after(PROGRESS_REFRESH_MS, self._drain)
+
     def update_video_name(self, name: str):
-        self.video_name.set(name)
+        self._publish('video name', name)
+
+    def update_jobs(self, job_lines: list):
+        '''Shows one line per running download, in place of the single video name.'''
+        self._publish('video name', '\n'.join(job_lines))
+
+    def set_job_slots(self, job_slots: int):
+        '''Makes room for a line per simultaneous download.'''
+        self._publish('job slots', job_slots)
 
-    def update_status_downloading(self, item_num: int, total_item_num: int):
-        self.update_status(f'Downloading video {item_num + 1} of {total_item_num}')
+    def _resize(self, job_slots: int):
+        self.top.geometry(f'{self.window_width}x{self.window_height + 20 * (job_slots - 1)}')
 
     def update_status(self, new_status: str):
-        self.status.set(new_status)
+        self._publish('status', new_status)
+
+    def update_pipeline(self, stages: list):
+        '''Shows how busy each stage of a pipelined batch is, e.g. "Found 120 > Resolving 8/8 > Queued 6/6 > Downloading 3/3".'''
+        self._publish('pipeline', stages)
+
+    def _update_pipeline(self, stages: list):
+        self.pipeline.set(' > '.join(
+            f'{stage} {occupancy}' if capacity is None else f'{stage} {occupancy}/{capacity}' 
+            for stage, occupancy, capacity in stages
+            ))
 
     def _update_download_percent(self, dl_percent: float):
         if dl_percent == 100.0:
@@ -659,97 +820,15 @@ class ProgressBar:
         self.download_percentage.set(f'{dl_percent:.1f}%')
 
     def update_progress(self, percent: float):
+        self._publish('progress', percent)
+
+    def _update_bar(self, percent: float):
         self.bar['value'] = percent
         self._update_download_percent(percent)
        
     def kill(self):
-        self.top.destroy()
-
-
-class VideoDownloader:
-    def __init__(self, url: str, save_directory=os.getcwd(), resolution=Resolution().default_res) -> None:
-        self.url = url
-        self.progress_bar = None
-        self.resolution = resolution
-        self.output_filename = None
-        self.save_directory = save_directory
-        self.resolution_prefix = False
-        self.percent_downloaded = 0
-    
-    def _validate_filename(self):
-        if self.output_filename.strip() == '':
-            return None
-        if not self.output_filename.endswith('mp4'):
-            self.output_filename += '.mp4'
-        return self.output_filename
-
-    def _call_on_progress_each_MB(self, MB: int):
-        # on_progress_callback called every X MB downloaded
-        request.default_range_size = 1048576 * MB 
-
-    def progress_check(self, stream=None, chunk = None, remaining = None):
-        # Gets the percentage of the file that has been downloaded.
-        percent_downloaded = (100*(stream.filesize - remaining))/stream.filesize
-        self.progress_bar.update_progress(percent_downloaded)
-        self.progress_bar.update_video_name(f'Video: {self.currently_downloading_title}')
-        
-    def add_resolution_prefix(self):
-        self.resolution_prefix = True
-    
-    def set_resolution(self, res: str):
-        if res in Resolution().options:
-            self.resolution = res
-    
-    def set_output_filename(self, output_name: str):  
-        self.output_filename = output_name  
-    
-    def set_save_directory(self, save_directory: str):
-        self.save_directory = save_directory
-    
-    def get_possible_resolutions(self, streams):
-        possible_resolutions = []
-        for stream in streams.filter(type='mp4'):
-            res_num = int(stream.resolution[:-1])
-            if res_num not in possible_resolutions:
-                possible_resolutions.append(res_num)
-
-        possible_resolutions = sorted(possible_resolutions)
-
-        return possible_resolutions
-
-    def set_progress_bar(self, bar: ProgressBar):
-        self.progress_bar = bar
-
-    def download_video(self):
-        self._call_on_progress_each_MB(1)
-        video = YouTube(url=self.url, on_progress_callback=self.progress_check)
-        self.currently_downloading_title = video.title
-        if self.resolution is None:
-            return
-
-        prefix = None
-        if self.resolution_prefix:
-            prefix = f'[{self.resolution}] '
-        try:
-            stream = video.streams.filter(
-                type='video',
-                res=self.resolution,
-                progressive=True
-                ).first()
-            stream.download(
-                            output_path=self.save_directory,
-                            filename_prefix=prefix
-                            )
-        except AttributeError:
-            # The resolution wanted, was not available. Reducing to the next available resolution and retry.
-            self.resolution = Resolution().downgrade(self.resolution)
-            self.download_video()
-        except tk._tkinter.TclError:
-            # Download was stopped unexpectedly (probably manually)
-            # Delete current file, as the download is incomplete
-            Messages().download_stopped()
-            os.unlink(stream.get_file_path(output_path=self.save_directory, filename_prefix=prefix))
-            raise RuntimeError('Download stopped unexpectedly')
+        '''Closes the window on the next tick. Safe to call from any thread.'''
+        self.events.put(('kill', ()))
 
 
 class Messages:
@@ -773,6 +852,11 @@ class Messages:
         m = 'Something went wrong\nPlease check your internet connection and try again'
         return messagebox.showerror(title=t, message=m)
     
+    def invalid_keywords(self, reason: str):
+        t = 'Invalid keywords'
+        m = f'{reason}\nSeparate keywords with commas, OR, AND and NOT, e.g. "review AND NOT unboxing"'
+        return messagebox.showerror(title=t, message=m)
+
     def invalid_channel_name(self):
         t = 'Invalid channel name'
         m = 'Please enter a valid Youtube channel name'
@@ -798,57 +882,124 @@ class Messages:
         m = 'Please enter a valid YouTube URL'
         return messagebox.showerror(title=t, message=m)
 
+    def invalid_video_list(self):
+        t = 'No videos'
+        m = 'Could not find any YouTube video URLs in the list'
+        return messagebox.showerror(title=t, message=m)
+
+    def video_list_summary(self, downloaded: int, skipped: int, failed_urls: list, invalid: int, duplicates: int, stopped: bool):
+        t = 'Download stopped' if stopped else 'Complete'
+        lines = [f'Downloaded {downloaded} video(s)']
+        if skipped:
+            lines.append(f'{skipped} were downloaded already')
+        if failed_urls:
+            lines.append(f'{len(failed_urls)} failed:')
+            lines += failed_urls[:5]
+            if len(failed_urls) > 5:
+                lines.append('...')
+        if invalid:
+            lines.append(f'{invalid} line(s) had no video URL')
+        if duplicates:
+            lines.append(f'{duplicates} duplicate(s) were left out')
+        m = '\n'.join(lines)
+        if stopped or failed_urls:
+            return messagebox.showerror(title=t, message=m)
+        return messagebox.showinfo(title=t, message=m)
+
     def invalid_save_dir(self):
         t = 'Invalid directory'
         m = 'Please enter a valid save directory'
         return messagebox.showerror(title=t, message=m)
 
-    def process_time_warning(self):
-        t = 'Process time warning'
-        m = 'WARNING!\n\nThis method is very slow.\nIt is highly recommended to use the playlist URL function instead.\n\nDo you want to continue anyways?'
-        return messagebox.askyesno(title=t, message=m)
-
-    def suggest_playlist(self, playlist: Playlist):
+    def suggest_playlist(self, title: str):
         t = 'Suggestion'
-        m = f'Found the playlist called {playlist.title}\nThe name looks similar to what you were looking for!\nDo you want to download it?'
+        m = f'Found the playlist called {title}\nThe name looks similar to what you were looking for!\nDo you want to download it?'
         return messagebox.askyesno(title=t, message=m)
 
+    def resume_downloads(self, title: str, jobs_left: int, fed: bool = True):
+        t = 'Unfinished download'
+        left = f'{jobs_left} video(s) left.' if fed else f'{jobs_left} video(s) left, and more may still be found.'
+        m = f'The download of "{title}" was not finished last time.\n{left}\n\nDo you want to continue it?'
+        return messagebox.askyesno(title=t, message=m)
 
-class Validate:
-    def _delete_special_chars(self, text: str):
-        special_chars = ['\\', '/', '|', ':', '&', '*', '?', '>', '<']
-        for char in special_chars:
-            text = text.replace(char, '')
-        return text
-
-    def validate_save_directory(self, base_save_dir: str, subfolders: list):
-        validated_subfolders = []
-        for subfolder in subfolders:
-            validated_subfolders.append(self._delete_special_chars(subfolder))
-
-        validated_subfolders = '/'.join(validated_subfolders)
-        path = Path(base_save_dir).joinpath(validated_subfolders)
-        path.mkdir(parents=True, exist_ok=True)
-        return path
-    
-    def validate_channel_name(self, channel_name: str):
-        '''
-        Returns a string without whitespace.
-        To prevent user from downloading the wrong channel, e.g. the channel 'tech', when searching for channel name 'tech tips'.
-        '''
-        return channel_name.replace(' ', '').strip()
 
-root = tk.Tk()
-root.title('MyTube')
-root.geometry(f'{WINDOW_WIDTH}x{WINDOW_HEIGHT}')
-root.maxsize(width=WINDOW_WIDTH, height=WINDOW_HEIGHT)
-root.minsize(width=WINDOW_WIDTH, height=WINDOW_HEIGHT)
-app = App(root)
+def resume_unfinished_downloads(root: tk.Tk, options: OptionsTab):
+    '''Offers to continue every download still queued when the app was closed, and forgets the ones declined.'''
+    messages = Messages()
+    queue = JobQueue()
+    for batch, title, jobs_left, fed in queue.unfinished_batches():
+        if not messages.resume_downloads(title, jobs_left, fed):
+            queue.discard(batch)
+            continue
+        Thread(target=_resume_download, args=(root, options, batch)).start()
 
-options = OptionsTab(app)
-video = VideoTab(app, options=options)
-channel = ChannelTab(app, options=options)
-playlist = PlaylistTab(app, options=options)
-about = AboutTab(app)
 
-root.mainloop()
\ No newline at end of file
+def _resume_download(root: tk.Tk, options: OptionsTab, batch: str):
+    messages = Messages()
+    progress_bar = ProgressBar(root)
+    downloader = options.get_batch_downloader(progress_bar)
+    if downloader is None:
+        progress_bar.kill()
+        return
+    try:
+        result = downloader.resume(batch)
+    except DownloadCancelled:
+        progress_bar.kill()
+        messages.download_stopped()
+        return
+    except (MyTubeError, exceptions.PytubeError, HTTPError):
+        progress_bar.kill()
+        messages.connection_error()
+        return
+    progress_bar.kill()
+    if result.stopped:
+        messages.download_stopped()
+        return
+    messages.download_complete()
+
+
+def report_startup_time(root: tk.Tk, imports_done: float, window_built: float):
+    '''Prints how long the startup took as JSON, and closes the app.'''
+    timings = {
+        'imports_s' : round(imports_done - STARTUP_STARTED, 4),
+        'window_s' : round(window_built - imports_done, 4),
+        'ready_s' : round(perf_counter() - STARTUP_STARTED, 4),
+        'modules_loaded' : len(sys.modules)
+        }
+    print(json.dumps(timings))
+    root.destroy()
+
+
+def close_app(root: tk.Tk):
+    '''Closes the app. Its downloads stop, and are offered to be continued on the next start.'''
+    APP_CLOSING.set()
+    root.destroy()
+
+
+def main():
+    imports_done = perf_counter()
+    root = tk.Tk()
+    root.protocol('WM_DELETE_WINDOW', lambda: close_app(root))
+    root.title('MyTube')
+    root.geometry(f'{WINDOW_WIDTH}x{WINDOW_HEIGHT}')
+    root.maxsize(width=WINDOW_WIDTH, height=WINDOW_HEIGHT)
+    root.minsize(width=WINDOW_WIDTH, height=WINDOW_HEIGHT)
+    app = App(root)
+
+    options = OptionsTab(app)
+    video = VideoTab(app, options=options)
+    channel = ChannelTab(app, options=options)
+    playlist = PlaylistTab(app, options=options)
+    about = AboutTab(app)
+
+    if '--startup-time' in sys.argv:
+        # Measurement mode, the app is ready once the event loop is idle for the first time
+        window_built = perf_counter()
+        root.after_idle(report_startup_time, root, imports_done, window_built)
+    else:
+        root.after_idle(resume_unfinished_downloads, root, options)
+    root.mainloop()
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
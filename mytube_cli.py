@@ -0,0 +1,131 @@
+'''
+Command line interface of MyTube, for scripted and headless batch downloads.
+The result of every run is printed to stdout as JSON, progress goes to stderr.
+
+    python mytube_cli.py video URL [URL ...]
+    python mytube_cli.py video --list urls.csv
+    python mytube_cli.py playlist URL
+    python mytube_cli.py channel NAME [--timeframe Week] [--keywords "news, sport"] [--new-only]
+'''
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+from urllib.error import HTTPError
+
+from pytube import exceptions
+
+from mytube_core import (
+    DEFAULT_DOWNLOAD_WORKERS, 
+    MAX_DOWNLOAD_WORKERS, 
+    MAX_CONNECTIONS_PER_VIDEO, 
+    TIMEFRAME_OPTIONS, 
+    THROTTLE, 
+    METRICS, 
+    METRICS_DIR, 
+    PROFILER, 
+    PROFILE_DIR, 
+    Resolution, 
+    BatchDownloader, 
+    ProgressReporter, 
+    VideoList, 
+    MyTubeError
+    )
+
+
+class ConsoleProgress(ProgressReporter):
+    '''Writes every change of status to stderr, keeping stdout for the result.'''
+    def __init__(self, quiet: bool = False) -> None:
+        self.quiet = quiet
+        self.last_status = None
+
+    def update_status(self, new_status: str):
+        if self.quiet or new_status == self.last_status:
+            return
+        self.last_status = new_status
+        print(new_status, file=sys.stderr, flush=True)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='mytube', description='Download YouTube videos, playlists and channels.')
+    parser.add_argument('-o', '--output', default=os.getcwd(), help='directory to save in (default: current directory)')
+    parser.add_argument('-r', '--resolution', default=Resolution().default_res, choices=Resolution().options, help='preferred resolution')
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_DOWNLOAD_WORKERS, help=f'videos to download at the same time (max {MAX_DOWNLOAD_WORKERS})')
+    parser.add_argument('-c', '--connections', type=int, default=1, help=f'connections per video (max {MAX_CONNECTIONS_PER_VIDEO})')
+    parser.add_argument('--max-speed', type=float, default=0, metavar='KBPS', help='download speed limit in KB/s, shared by all downloads (default: unlimited)')
+    parser.add_argument('--max-requests', type=float, default=0, metavar='N', help='limit of HTTP requests per second (default: unlimited)')
+    parser.add_argument('--metrics-dir', default=str(METRICS_DIR), metavar='DIR', help=f'directory to write the download metrics to, as downloads.jsonl and mytube.prom (default: {METRICS_DIR})')
+    parser.add_argument('--profile', nargs='?', const=str(PROFILE_DIR), metavar='DIR', help=f'profile the downloads with cProfile and tracemalloc, writing the profiles to DIR (default: {PROFILE_DIR})')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not write progress to stderr')
+    modes = parser.add_subparsers(dest='mode', required=True)
+
+    video = modes.add_parser('video', help='download single videos')
+    video.add_argument('urls', nargs='*', metavar='URL')
+    video.add_argument('--list', metavar='FILE', help='text or CSV file of video URLs, one per line, optionally followed by a comma and the file name to save it as')
+
+    playlist = modes.add_parser('playlist', help='download a playlist')
+    playlist.add_argument('url', metavar='URL')
+
+    channel = modes.add_parser('channel', help='download the videos of a channel')
+    channel.add_argument('name', metavar='NAME')
+    channel.add_argument('--timeframe', default='All Time', choices=list(TIMEFRAME_OPTIONS), help='only videos published within the past ...')
+    channel.add_argument('--keywords', default='', help='comma separated keywords to look for')
+    channel.add_argument('--new-only', action='store_true', help='only videos newer than the ones downloaded last time')
+
+    modes.add_parser('resume', help='continue the downloads left unfinished when MyTube was closed')
+    return parser
+
+
+def main(argv=None):
+    '''Runs the command line, and returns the exit code: 0 on success, 1 if any video failed, 2 if nothing could be downloaded.'''
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.mode == 'video' and not args.urls and args.list is None:
+        parser.error('give video URLs, or a file of them with --list')
+    THROTTLE.set_limits(max(args.max_speed, 0) * 1024, max(args.max_requests, 0))
+    METRICS.set_directory(Path(args.metrics_dir))
+    if args.profile is not None:
+        PROFILER.set_directory(Path(args.profile))
+    downloader = BatchDownloader(
+        save_dir=args.output,
+        resolution=args.resolution,
+        workers=min(max(args.workers, 1), MAX_DOWNLOAD_WORKERS),
+        connections=min(max(args.connections, 1), MAX_CONNECTIONS_PER_VIDEO),
+        progress=ConsoleProgress(args.quiet)
+        )
+
+    videos = None
+    if args.mode == 'video' and args.list is not None:
+        try:
+            with open(args.list, encoding='utf-8-sig', newline='') as file:
+                videos = VideoList('\n'.join(args.urls + [file.read()]))
+        except OSError as error:
+            parser.error(f'can\'t read {args.list}: {error.strerror}')
+
+    try:
+        if videos is not None:
+            result = downloader.download_video_list(videos)
+        elif args.mode == 'video':
+            result = downloader.download_urls(args.urls)
+        elif args.mode == 'playlist':
+            result = downloader.download_playlist(args.url)
+        elif args.mode == 'resume':
+            result = downloader.resume_all()
+        else:
+            result = downloader.download_channel(args.name, args.timeframe, args.keywords, args.new_only)
+    except (MyTubeError, HTTPError, exceptions.PytubeError) as error:
+        print(json.dumps({'mode' : args.mode, 'error' : type(error).__name__, 'message' : str(error)}, indent=2))
+        return 2
+
+    output = {'mode' : args.mode, **result.to_dict()}
+    if videos is not None:
+        output.update({'invalid' : videos.invalid, 'duplicates' : videos.duplicates})
+    print(json.dumps(output, indent=2))
+    if result.failed or result.stopped:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
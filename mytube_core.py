@@ -0,0 +1,2771 @@
+'''
+Headless download core of MyTube.
+Everything needed to download videos, playlists and channels, without any GUI.
+Used by the Tk GUI in mytube_app.py and the command line interface in mytube_cli.py.
+'''
+import re
+import os
+import json
+import sqlite3
+import hashlib
+import shutil
+import random
+import io
+import base64
+import cProfile
+import pstats
+import tracemalloc
+from functools import wraps
+from uuid import uuid4
+from threading import Lock, Event, Condition, BoundedSemaphore
+from time import monotonic, time
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, Counter
+from contextlib import closing
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from pathlib import Path
+import ssl
+import socket
+from http.client import HTTPConnection, HTTPSConnection, HTTPException, IncompleteRead, RemoteDisconnected
+from urllib.error import HTTPError
+from urllib.parse import quote, unquote, urlsplit, urljoin
+from urllib.request import getproxies, proxy_bypass
+
+from pytube import Playlist, YouTube, Channel, request, extract, exceptions
+
+DEFAULT_DOWNLOAD_WORKERS = 3
+MAX_DOWNLOAD_WORKERS = 8
+MAX_CONNECTIONS_PER_VIDEO = 8
+MIN_SEGMENT_SIZE = 1048576
+INITIAL_CHUNK_SIZE = 1048576
+MIN_CHUNK_SIZE = 262144
+MAX_CHUNK_SIZE = 16777216
+TARGET_CHUNK_SECONDS = 1.0
+METADATA_PREFETCH_WINDOW = 8
+PIPELINE_QUEUED_JOBS = 6
+THROTTLE_BLOCK_SIZE = 65536
+POOL_MAX_CONNECTIONS_PER_HOST = 16
+POOL_IDLE_SECONDS = 60
+MAX_REDIRECTS = 5
+DATA_DIR = Path.home().joinpath('.mytube')
+STORE_DIR_NAME = '.mytube-store'
+METADATA_CACHE_TTL_DAYS = 7
+METADATA_CACHE_MAX_ENTRIES = 50_000
+PLAYLIST_CATALOG_TTL_HOURS = 24
+PLAYLIST_SUGGESTIONS = 5
+PLAYLIST_MATCH_MIN_SCORE = 0.5
+HTTP_TIMEOUT = 30
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE_SECONDS = 2
+JOB_RETRY_MAX_SECONDS = 300
+JOB_PRIORITY_VIDEO = 10
+JOB_PRIORITY_BATCH = 0
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN_SECONDS = 60
+BREAKER_MAX_COOLDOWN_SECONDS = 900
+METRICS_DIR = DATA_DIR.joinpath('metrics')
+METRICS_PEAK_WINDOW_SECONDS = 1.0
+PROFILE_ENV_VAR = 'MYTUBE_PROFILE'
+PROFILE_DIR = DATA_DIR.joinpath('profiles')
+PROFILE_TOP_N = 30
+YOUTUBE_URL = 'https://www.youtube.com'
+INNERTUBE_CLIENT = {'clientName' : 'WEB', 'clientVersion' : '2.20230427.04.00'}
+TIMEFRAME_OPTIONS = {
+    'Day' : 1,
+    'Week' : 7,
+    'Month' : 31,
+    'Year' : 365,
+    'All Time' : 10_000
+    }
+
+
+class MyTubeError(Exception):
+    '''Base class of the errors the download core reports to the GUI or command line.'''
+
+
+class InvalidChannelError(MyTubeError):
+    '''The channel does not exist, or has no videos.'''
+
+
+class InvalidPlaylistError(MyTubeError):
+    '''The playlist URL is not valid, or the playlist has no videos.'''
+
+
+class NoVideosFoundError(MyTubeError):
+    '''No videos match the requirements given.'''
+
+
+class InvalidKeywordsError(MyTubeError):
+    '''The keyword expression can't be parsed, e.g. an AND without a keyword after it.'''
+
+
+class DownloadCancelled(MyTubeError):
+    '''Raised by a progress reporter to stop the download it is reporting on, e.g. when its progress window is closed.'''
+
+
+class DownloadInterrupted(DownloadCancelled):
+    '''Raised by a progress reporter when the app is closing: the download stops, but stays queued to be resumed.'''
+
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket, refilled at "rate" tokens per second up to one second's worth. A rate of 0 means unlimited.
+    take() blocks until enough tokens are available. The rate can be changed at any time, also while threads are waiting.
+    '''
+    def __init__(self, rate: float = 0) -> None:
+        self.rate = max(rate, 0)
+        self.tokens = self.rate
+        self.updated_at = monotonic()
+        self.condition = Condition()
+
+    def _refill(self):
+        now = monotonic()
+        if self.rate > 0:
+            self.tokens = min(self.tokens + (now - self.updated_at) * self.rate, self.rate)
+        self.updated_at = now
+
+    def set_rate(self, rate: float):
+        with self.condition:
+            self._refill()
+            self.rate = max(rate, 0)
+            self.tokens = min(self.tokens, self.rate)
+            # Waiting threads recalculate how long to wait with the new rate
+            self.condition.notify_all()
+
+    def take(self, amount: float = 1):
+        with self.condition:
+            while True:
+                self._refill()
+                if self.rate == 0:
+                    return
+                # More than a second's worth is let through once the bucket is full, leaving it in debt
+                needed = min(amount, self.rate)
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                self.condition.wait((needed - self.tokens) / self.rate)
+
+
+class Throttle:
+    '''
+    Process-wide limits on the download speed and the request rate, shared by all downloads, whichever tab or thread started them.
+    0 means unlimited. Used through the THROTTLE instance below.
+    '''
+    def __init__(self) -> None:
+        self.bandwidth = TokenBucket()
+        self.requests = TokenBucket()
+
+    def set_limits(self, bytes_per_second: float = 0, requests_per_second: float = 0):
+        self.bandwidth.set_rate(bytes_per_second)
+        self.requests.set_rate(requests_per_second)
+
+    def before_request(self):
+        '''Blocks until another HTTP request may be sent.'''
+        self.requests.take()
+
+    def before_transfer(self, size: int):
+        '''Blocks until another "size" bytes may be downloaded.'''
+        self.bandwidth.take(size)
+
+
+THROTTLE = Throttle()
+
+
+class PooledResponse:
+    '''
+    Response of a ConnectionPool request. Reads like the response of urlopen.
+    Its connection goes back to the pool once the body has been read to the end, or is closed if the response is closed early.
+    '''
+    def __init__(self, pool: 'ConnectionPool', key: tuple, connection: HTTPConnection, response, url: str) -> None:
+        self.pool = pool
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        if response.length == 0:
+            # Nothing to read, e.g. the response to a HEAD request
+            response.read()
+        self._release_if_done()
+
+    def _release_if_done(self):
+        if self.connection is not None and self.response.isclosed():
+            self.pool._release(self.key, self.connection, reusable=not self.response.will_close)
+            self.connection = None
+
+    def read(self, amount: int = None):
+        data = self.response.read(amount)
+        self._release_if_done()
+        return data
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def close(self):
+        if self.connection is not None:
+            # The rest of the body was not read, the connection can not be used again
+            self.pool._release(self.key, self.connection, reusable=False)
+            self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+class ConnectionPool:
+    '''
+    Process-wide pool of keep-alive HTTP(S) connections, at most "max_per_host" per host, 
+    so chunked stream fetches and page fetches don't pay a new TCP and TLS handshake per request.
+    A connection the server closed while idle is replaced transparently. Redirects are followed, and error responses raise HTTPError, like urlopen.
+    Hosts can be routed to another server, e.g. the local stand-in server of the benchmarks.
+    Like urlopen, requests go through the proxy set in HTTP_PROXY / HTTPS_PROXY, unless NO_PROXY lists the host: 
+    http requests are sent to the proxy as is, https requests through a CONNECT tunnel. Routed hosts are connected to directly.
+    Used through the POOL instance below.
+    '''
+    def __init__(self, max_per_host: int = POOL_MAX_CONNECTIONS_PER_HOST, idle_seconds: float = POOL_IDLE_SECONDS) -> None:
+        self.max_per_host = max_per_host
+        self.idle_seconds = idle_seconds
+        self.ssl_context = ssl.create_default_context()
+        self.lock = Lock()
+        self.idle = {}
+        self.slots = {}
+        self.routes = {}
+        self.proxies = getproxies()
+        self.connections_opened = 0
+        self.requests = 0
+        self.reused = 0
+
+    def _acquire(self, key: tuple, timeout: float):
+        '''Returns an idle connection to the host, or a new one, waiting while the host has max_per_host connections in use.'''
+        with self.lock:
+            slots = self.slots.setdefault(key, BoundedSemaphore(self.max_per_host))
+        slots.acquire()
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            while idle:
+                connection, idle_since = idle.pop()
+                if monotonic() - idle_since < self.idle_seconds:
+                    self.reused += 1
+                    connection.timeout = timeout
+                    if connection.sock is not None:
+                        connection.sock.settimeout(timeout)
+                    return connection, True
+                connection.close()
+            self.connections_opened += 1
+
+        scheme, host, port, proxy = key
+        if proxy is None:
+            if scheme == 'https':
+                return HTTPSConnection(host, port, timeout=timeout, context=self.ssl_context), False
+            return HTTPConnection(host, port, timeout=timeout), False
+        proxy_port = proxy.port or 80
+        if scheme == 'https':
+            connection = HTTPSConnection(proxy.hostname, proxy_port, timeout=timeout, context=self.ssl_context)
+            connection.set_tunnel(host, port, headers=self._proxy_headers(proxy))
+            return connection, False
+        return HTTPConnection(proxy.hostname, proxy_port, timeout=timeout), False
+
+    def _proxy_for(self, scheme: str, host: str):
+        '''Returns the split URL of the proxy for requests to the host, or None to connect directly.'''
+        proxy = self.proxies.get(scheme)
+        if not proxy or proxy_bypass(host):
+            return None
+        if '://' not in proxy:
+            proxy = f'http://{proxy}'
+        return urlsplit(proxy)
+
+    def _proxy_headers(self, proxy):
+        '''Basic authentication with the proxy, if its URL has a user name.'''
+        if proxy.username is None:
+            return {}
+        credentials = f'{unquote(proxy.username)}:{unquote(proxy.password or "")}'
+        return {'Proxy-Authorization' : 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')}
+
+    def _release(self, key: tuple, connection: HTTPConnection, reusable: bool = True):
+        with self.lock:
+            if reusable:
+                self.idle.setdefault(key, []).append((connection, monotonic()))
+            else:
+                connection.close()
+            slots = self.slots[key]
+        slots.release()
+
+    def route(self, hosts, base_url: str = None):
+        '''
+        Sends the requests for these hosts to base_url instead, e.g. "http://127.0.0.1:8080", keeping their path and query.
+        Without a base_url the hosts are no longer routed.
+        '''
+        with self.lock:
+            for host in hosts:
+                if base_url is None:
+                    self.routes.pop(host, None)
+                else:
+                    self.routes[host] = urlsplit(base_url)
+
+    def request(self, method: str, url: str, headers: dict = {}, data: bytes = None, timeout: float = HTTP_TIMEOUT):
+        '''Sends the request over a pooled connection and returns a PooledResponse. Raises HTTPError for error responses.'''
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            route = self.routes.get(parts.hostname)
+            if route is not None:
+                parts = parts._replace(scheme=route.scheme, netloc=route.netloc)
+            scheme = parts.scheme.lower()
+            if scheme not in ('http', 'https'):
+                raise ValueError(f'Invalid URL: {url}')
+            # Routed hosts are connected to directly
+            proxy = None if route is not None else self._proxy_for(scheme, parts.hostname)
+            key = (scheme, parts.hostname, parts.port or (443 if scheme == 'https' else 80), proxy)
+            path = parts.path or '/'
+            if parts.query:
+                path += f'?{parts.query}'
+            request_headers = headers
+            if proxy is not None and scheme == 'http':
+                # Plain http goes to the proxy with the full URL, the tunnel of https needs no change
+                path = f'http://{parts.netloc}{path}'
+                request_headers = {**headers, **self._proxy_headers(proxy)}
+
+            response = self._send(key, method, path, request_headers, data, timeout, url)
+            if response.status in (301, 302, 303, 307, 308) and response.headers.get('Location'):
+                response.read()
+                url = urljoin(url, response.headers['Location'])
+                if response.status == 303 or (response.status in (301, 302) and method == 'POST'):
+                    method, data = 'GET', None
+                continue
+            if response.status >= 400:
+                # Read the body, so the connection can be used again
+                response.read()
+                raise HTTPError(url, response.status, response.reason, response.headers, None)
+            return response
+        raise HTTPError(url, response.status, 'Too many redirects', response.headers, None)
+
+    def _send(self, key: tuple, method: str, path: str, headers: dict, data: bytes, timeout: float, url: str):
+        connection, reused = self._acquire(key, timeout)
+        with self.lock:
+            self.requests += 1
+        try:
+            connection.request(method, path, body=data, headers=headers)
+            response = connection.getresponse()
+        except (RemoteDisconnected, ConnectionResetError, BrokenPipeError) as error:
+            self._release(key, connection, reusable=False)
+            if not reused:
+                raise
+            # The server closed the connection while it was idle, try once more on a new one
+            connection, reused = self._acquire(key, timeout)
+            try:
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+            except BaseException:
+                self._release(key, connection, reusable=False)
+                raise error
+        except BaseException:
+            self._release(key, connection, reusable=False)
+            raise
+        return PooledResponse(self, key, connection, response, url)
+
+    def stats(self):
+        '''Returns the pool size and how often connections were reused.'''
+        with self.lock:
+            return {
+                'max_per_host' : self.max_per_host,
+                'connections_opened' : self.connections_opened,
+                'requests' : self.requests,
+                'reused' : self.reused,
+                'idle' : sum(len(idle) for idle in self.idle.values())
+                }
+
+
+POOL = ConnectionPool()
+
+
+def _pooled_execute_request(url, method=None, headers=None, data=None, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+    '''
+    Stands in for pytube's request._execute_request, which every request pytube makes goes through, 
+    e.g. for the watch pages, player responses and playlist pages of the metadata.
+    Sends them over the POOL, within the THROTTLE limits.
+    '''
+    base_headers = {'User-Agent': 'Mozilla/5.0', 'accept-language': 'en-US,en'}
+    if headers:
+        base_headers.update(headers)
+    if data and not isinstance(data, bytes):
+        data = bytes(json.dumps(data), encoding='utf-8')
+    if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+        timeout = HTTP_TIMEOUT
+    THROTTLE.before_request()
+    return POOL.request(method or ('POST' if data else 'GET'), url, base_headers, data, timeout)
+
+
+request._execute_request = _pooled_execute_request
+
+
+class Resolution:
+    def __init__(self) -> None:
+        self.options = [
+            '144p',
+            '360p',
+            '480p',
+            '720p'
+            ]        
+        self.default_res = self.options[3]
+
+    
+    def downgrade(self, current_resolution: str):
+        next_resolution_index = self.options.index(current_resolution) - 1
+        if next_resolution_index == -1:
+            return None
+        return self.options[next_resolution_index]
+
+
+class ProgressReporter:
+    '''
+    Receives the progress of downloads, and does nothing with it.
+    The GUI's ProgressBar and the command line's progress output build on it.
+    Any of the methods may raise DownloadCancelled, to stop the download being reported on.
+    '''
+    def set_job_slots(self, job_slots: int):
+        pass
+
+    def update_status(self, new_status: str):
+        pass
+
+    def update_status_downloading(self, item_num: int, total_item_num: int):
+        self.update_status(f'Downloading video {item_num + 1} of {total_item_num}')
+
+    def update_status_batch(self, completed: int, active: int, total: int):
+        self.update_status(f'Downloaded {completed} of {total} videos ({active} in progress)')
+
+    def update_video_name(self, name: str):
+        pass
+
+    def update_jobs(self, job_lines: list):
+        pass
+
+    def update_pipeline(self, stages: list):
+        '''Called with a (stage, occupancy, capacity) per stage of a pipelined batch, capacity None if unbounded.'''
+        pass
+
+    def update_progress(self, percent: float):
+        pass
+
+
+class DownloadMetrics:
+    '''
+    Timings and throughput of one download attempt, taken along the download path. Its phases are
+    "metadata" (the player response), "manifest" (the watch page, base.js and picking the stream), 
+    "first_byte" (until the first byte of the stream arrived) and "transfer" (the rest of the stream).
+    The peak throughput is the most bytes received in any METRICS_PEAK_WINDOW_SECONDS, over all connections.
+    '''
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.started_at = datetime.now()
+        self.phases = {}
+        self.phase_started = monotonic()
+        self.bytes = 0
+        self.transfer_started = None
+        self.windows = Counter()
+        self.lock = Lock()
+
+    def end_phase(self, phase: str):
+        '''Records the time since the previous phase ended as the time taken by this one.'''
+        now = monotonic()
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0) + now - self.phase_started
+            self.phase_started = now
+
+    def _start_transfer(self, now: float):
+        if self.transfer_started is None:
+            self.phases['first_byte'] = now - self.phase_started
+            self.phase_started = self.transfer_started = now
+
+    def response_started(self):
+        '''Records a response of the stream coming in. The first one ends the "first_byte" phase.'''
+        with self.lock:
+            self._start_transfer(monotonic())
+
+    def add_bytes(self, size: int):
+        '''Records bytes of the stream received.'''
+        now = monotonic()
+        with self.lock:
+            self._start_transfer(now)
+            self.bytes += size
+            self.windows[int((now - self.transfer_started) / METRICS_PEAK_WINDOW_SECONDS)] += size
+
+    def to_dict(self):
+        '''Returns the metrics as plain, JSON serializable data, throughputs in bytes per second.'''
+        with self.lock:
+            transfer_seconds = self.phases.get('transfer', 0)
+            average = self.bytes / transfer_seconds if transfer_seconds > 0 else 0
+            # Downloads shorter than a window never fill one
+            peak = max(max(self.windows.values(), default=0) / METRICS_PEAK_WINDOW_SECONDS, average)
+            return {
+                'url' : self.url,
+                'started_at' : self.started_at.isoformat(timespec='seconds'),
+                'phases' : {phase : round(seconds, 4) for phase, seconds in self.phases.items()},
+                'bytes' : self.bytes,
+                'throughput_average_bps' : round(average),
+                'throughput_peak_bps' : round(peak)
+                }
+
+
+class MetricsExporter:
+    '''
+    Writes the metrics of every download attempt as a line of "downloads.jsonl", 
+    and the totals of this process to "mytube.prom" in the Prometheus text format, 
+    e.g. for the textfile collector of the node exporter on every worker.
+    Used through the METRICS instance below, which writes to METRICS_DIR unless set_directory() says otherwise.
+    '''
+    def __init__(self, directory: Path = METRICS_DIR) -> None:
+        self.directory = directory
+        self.lock = Lock()
+        self.outcomes = Counter()
+        self.bytes = 0
+        self.downgrades = 0
+        self.phase_seconds = Counter()
+        self.phase_counts = Counter()
+        self.last_throughput = {'average' : 0, 'peak' : 0}
+
+    def set_directory(self, directory: Path):
+        '''Writes the metrics to this directory from now on, or nowhere if it is None.'''
+        with self.lock:
+            self.directory = directory
+
+    def record(self, metrics: dict):
+        '''Adds the metrics of a download attempt, as returned by DownloadMetrics.to_dict() plus the job's outcome.'''
+        with self.lock:
+            self.outcomes[metrics['status']] += 1
+            self.bytes += metrics['bytes']
+            if metrics['downgraded']:
+                self.downgrades += 1
+            for phase, seconds in metrics['phases'].items():
+                self.phase_seconds[phase] += seconds
+                self.phase_counts[phase] += 1
+            if metrics['status'] == 'completed' and metrics['bytes'] > 0:
+                self.last_throughput = {'average' : metrics['throughput_average_bps'], 'peak' : metrics['throughput_peak_bps']}
+
+            if self.directory is None:
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory.joinpath('downloads.jsonl'), 'a', encoding='utf-8') as file:
+                file.write(json.dumps(metrics) + '\n')
+            # Replaced in one go, so a scraper never reads half a file
+            prom_path = self.directory.joinpath('mytube.prom')
+            temp_path = prom_path.with_suffix('.prom.tmp')
+            temp_path.write_text(self._prometheus_text(), encoding='utf-8')
+            os.replace(temp_path, prom_path)
+
+    def _prometheus_text(self):
+        lines = [
+            '# HELP mytube_downloads_total Download attempts by outcome, "retrying" ones are retried later.',
+            '# TYPE mytube_downloads_total counter',
+            *[f'mytube_downloads_total{{status="{status}"}} {count}' for status, count in sorted(self.outcomes.items())],
+            '# HELP mytube_download_bytes_total Bytes of video streams received.',
+            '# TYPE mytube_download_bytes_total counter',
+            f'mytube_download_bytes_total {self.bytes}',
+            '# HELP mytube_resolution_downgrades_total Downloads saved below the resolution asked for, as it was not available.',
+            '# TYPE mytube_resolution_downgrades_total counter',
+            f'mytube_resolution_downgrades_total {self.downgrades}',
+            '# HELP mytube_download_phase_seconds Time taken by each phase of the downloads.',
+            '# TYPE mytube_download_phase_seconds summary'
+            ]
+        for phase in sorted(self.phase_counts):
+            lines.append(f'mytube_download_phase_seconds_sum{{phase="{phase}"}} {self.phase_seconds[phase]:.4f}')
+            lines.append(f'mytube_download_phase_seconds_count{{phase="{phase}"}} {self.phase_counts[phase]}')
+        lines += [
+            '# HELP mytube_last_download_throughput_bytes_per_second Average and peak throughput of the last completed download.',
+            '# TYPE mytube_last_download_throughput_bytes_per_second gauge',
+            *[f'mytube_last_download_throughput_bytes_per_second{{stat="{stat}"}} {value}' for stat, value in self.last_throughput.items()],
+            '# HELP mytube_metrics_updated_timestamp_seconds When these metrics were last written.',
+            '# TYPE mytube_metrics_updated_timestamp_seconds gauge',
+            f'mytube_metrics_updated_timestamp_seconds {time():.0f}'
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsExporter()
+
+
+class Profiler:
+    '''
+    Opt-in profiling of the download entry points, which are decorated with PROFILER.profiled.
+    Switched on, every call of them writes a cProfile ".prof" file, e.g. for snakeviz or pstats, 
+    and a ".txt" summary of the PROFILE_TOP_N functions taking the most time and the lines allocating the most memory, sampled with tracemalloc.
+    cProfile only sees the thread it runs in, so the downloads of a batch are profiled per job, by their own download_video call.
+    Switched off, the decorated functions are called straight away.
+    '''
+    def __init__(self, directory: Path = None, top_n: int = PROFILE_TOP_N) -> None:
+        self.directory = directory
+        self.top_n = top_n
+        self.lock = Lock()
+        self.calls = 0
+        self.tracing = 0
+        self.started_tracemalloc = False
+
+    def set_directory(self, directory: Path):
+        '''Profiles into this directory from now on, or not at all if it is None.'''
+        self.directory = directory
+
+    def profiled(self, function):
+        '''Decorator profiling every call of the function while profiling is switched on.'''
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if self.directory is None:
+                return function(*args, **kwargs)
+            return self._profile(function, args, kwargs)
+        return wrapper
+
+    def _profile(self, function, args, kwargs):
+        directory = self.directory
+        with self.lock:
+            self.calls += 1
+            name = f'{datetime.now():%Y%m%d-%H%M%S}-{function.__qualname__}-{self.calls}'
+            # tracemalloc is process wide, it runs while any profiled call does
+            if self.tracing == 0:
+                self.started_tracemalloc = not tracemalloc.is_tracing()
+                if self.started_tracemalloc:
+                    tracemalloc.start()
+            self.tracing += 1
+        memory_before = tracemalloc.take_snapshot()
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active in this process, e.g. on Python 3.12 and newer, where they can't overlap
+            profile = None
+        started = monotonic()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            seconds = monotonic() - started
+            if profile is not None:
+                profile.disable()
+            memory_after = tracemalloc.take_snapshot()
+            current_memory, peak_memory = tracemalloc.get_traced_memory()
+            with self.lock:
+                self.tracing -= 1
+                if self.tracing == 0 and self.started_tracemalloc:
+                    tracemalloc.stop()
+            try:
+                self._write(directory, name, profile, seconds, memory_after.compare_to(memory_before, 'lineno'), peak_memory)
+            except OSError:
+                # Profiles are not worth failing a download over
+                pass
+
+    def _write(self, directory: Path, name: str, profile: cProfile.Profile, seconds: float, allocations: list, peak_memory: int):
+        directory.mkdir(parents=True, exist_ok=True)
+        summary = io.StringIO()
+        summary.write(f'{name}\nTook {seconds:.3f}s, peak traced memory {peak_memory / 1048576:.1f} MiB (whole process)\n\n')
+        if profile is None:
+            summary.write('No cProfile data, another profiler was active.\n\n')
+        else:
+            profile.dump_stats(directory.joinpath(f'{name}.prof'))
+            summary.write(f'Top {self.top_n} functions by cumulative time:\n')
+            pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(self.top_n)
+        summary.write(f'Top {self.top_n} lines by memory allocated during the call (whole process):\n')
+        for allocation in sorted(allocations, key=lambda allocation: allocation.size_diff, reverse=True)[:self.top_n]:
+            summary.write(f'{allocation}\n')
+        directory.joinpath(f'{name}.txt').write_text(summary.getvalue(), encoding='utf-8')
+
+
+def profile_directory(setting: str):
+    '''Returns the directory a MYTUBE_PROFILE setting stands for: PROFILE_DIR for "1", None if profiling is off.'''
+    setting = setting.strip()
+    if setting.lower() in ('', '0', 'false', 'no', 'off'):
+        return None
+    if setting.lower() in ('1', 'true', 'yes', 'on'):
+        return PROFILE_DIR
+    return Path(setting).expanduser()
+
+
+PROFILER = Profiler(profile_directory(os.environ.get(PROFILE_ENV_VAR, '')))
+
+
+class VideoDownloader:
+    def __init__(self, url: str, save_directory=os.getcwd(), resolution=Resolution().default_res) -> None:
+        self.url = url
+        self.progress_bar = ProgressReporter()
+        self.resolution = resolution
+        self.requested_resolution = resolution
+        self.output_filename = None
+        self.output_path = None
+        self.save_directory = save_directory
+        self.resolution_prefix = False
+        self.percent_downloaded = 0
+        self.connections = 1
+        self.bytes_downloaded = 0
+        self.chosen_resolution = None
+        self.available_resolutions = []
+        self.chunk_sizer = ChunkSizer()
+        self.metrics = DownloadMetrics(url)
+        self.store = None
+        self.from_store = False
+    
+    def _validate_filename(self):
+        '''Returns the file name to save the video as, or None to use its title.'''
+        return Validate().validate_video_filename(self.output_filename)
+
+    def progress_check(self, stream=None, chunk = None, remaining = None):
+        # Gets the percentage of the file that has been downloaded.
+        percent_downloaded = (100*(stream.filesize - remaining))/stream.filesize
+        self.progress_bar.update_progress(percent_downloaded)
+        self.progress_bar.update_video_name(f'Video: {self.currently_downloading_title}')
+        
+    def add_resolution_prefix(self):
+        self.resolution_prefix = True
+    
+    def set_resolution(self, res: str):
+        if res in Resolution().options:
+            self.resolution = res
+    
+    def set_output_filename(self, output_name: str):  
+        self.output_filename = output_name  
+    
+    def set_save_directory(self, save_directory: str):
+        self.save_directory = save_directory
+
+    def set_connections(self, connections: int):
+        '''Downloads the video over this many connections at once, each fetching its own byte range of the file.'''
+        self.connections = max(connections, 1)
+
+    def set_store(self, store: 'VideoStore'):
+        '''Downloads the video into the VideoStore, or takes it from there if it is already stored, and links it into the save directory.'''
+        self.store = store
+    
+    def get_possible_resolutions(self, streams):
+        possible_resolutions = []
+        for stream in streams.filter(progressive=True, type='video'):
+            if stream.resolution is None:
+                continue
+            res_num = int(stream.resolution[:-1])
+            if res_num not in possible_resolutions:
+                possible_resolutions.append(res_num)
+
+        possible_resolutions = sorted(possible_resolutions)
+
+        return possible_resolutions
+
+    def select_stream(self, streams):
+        '''
+        Returns the progressive stream of the wanted resolution, or else of the best resolution below it, 
+        or None if there is none. Works on the streams already fetched, so no resolution costs another request.
+        Sets chosen_resolution and available_resolutions, e.g. for logging.
+        '''
+        possible_resolutions = self.get_possible_resolutions(streams)
+        self.available_resolutions = [f'{res_num}p' for res_num in possible_resolutions]
+        wanted_res_num = int(self.resolution[:-1])
+        lower_resolutions = [res_num for res_num in possible_resolutions if res_num <= wanted_res_num]
+        if not lower_resolutions:
+            self.chosen_resolution = None
+            return None
+
+        self.chosen_resolution = f'{lower_resolutions[-1]}p'
+        candidates = streams.filter(progressive=True, type='video', res=self.chosen_resolution)
+        # Any container, e.g. the 3gpp 144p stream, but mp4 where there is a choice
+        return candidates.filter(file_extension='mp4').first() or candidates.first()
+
+    def set_progress_bar(self, bar: 'ProgressReporter'):
+        self.progress_bar = bar
+
+    @PROFILER.profiled
+    def download_video(self):
+        self.metrics = DownloadMetrics(self.url)
+        video = YouTube(url=self.url, on_progress_callback=self.progress_check)
+        self.video_id = video.video_id
+        self.currently_downloading_title = video.title
+        self.metrics.end_phase('metadata')
+        if self.resolution is None:
+            return
+
+        stream = self.select_stream(video.streams)
+        self.metrics.end_phase('manifest')
+        # The resolution wanted may not be available, the best one below it is used instead
+        self.resolution = self.chosen_resolution
+        if stream is None:
+            return
+
+        prefix = None
+        if self.resolution_prefix:
+            prefix = f'[{self.resolution}] '
+        try:
+            file_path = stream.get_file_path(filename=self._validate_filename(), output_path=self.save_directory, filename_prefix=prefix)
+            self.output_path = self._download_stream(stream, file_path)
+        except DownloadCancelled:
+            # Download was stopped unexpectedly (probably manually)
+            # The partial file is kept, so the next attempt resumes where this one stopped
+            raise RuntimeError('Download stopped unexpectedly')
+
+    def _split_segments(self, filesize: int):
+        '''Splits the file into a [start, position, end] byte range per connection, none smaller than MIN_SEGMENT_SIZE.'''
+        if filesize == 0:
+            return [[0, 0, 0]]
+        segment_count = max(min(self.connections, filesize // MIN_SEGMENT_SIZE), 1)
+        segment_size = -(-filesize // segment_count)
+        return [[start, start, min(start + segment_size, filesize)] for start in range(0, filesize, segment_size)]
+
+    def _download_stream(self, stream, file_path: str):
+        '''
+        Saves the stream at file_path. With a store, the stream is downloaded into it, 
+        unless it is stored already, and file_path is a hardlink to (or a copy of) the stored file.
+        '''
+        if stream.exists_at_path(file_path):
+            return file_path
+        if self.store is None:
+            return self._fetch_stream(stream, file_path)
+
+        with self.store.lock(self.video_id, self.resolution):
+            stored_path = self.store.path(self.video_id, self.resolution)
+            if stream.exists_at_path(stored_path):
+                self.from_store = True
+                self.progress_bar.update_progress(100.0)
+            else:
+                Path(stored_path).parent.mkdir(parents=True, exist_ok=True)
+                self._fetch_stream(stream, stored_path)
+            return self.store.materialize(stored_path, file_path)
+
+    def _fetch_stream(self, stream, file_path: str):
+        '''
+        Downloads the stream into a .part file next to file_path, and only renames it to file_path once it is complete.
+        The file is preallocated and its byte ranges are fetched in parallel, one per connection.
+        Continues a previous, interrupted download of the same stream from where it stopped.
+        '''
+        partial = PartialDownload(file_path, self.video_id, stream)
+        segments = partial.resume_segments()
+        if segments is None:
+            segments = self._split_segments(stream.filesize)
+            with open(partial.part_path, 'wb') as file:
+                file.truncate(stream.filesize)
+            partial.save(segments)
+
+        self.bytes_downloaded = sum(position - start for start, position, end in segments)
+        unfinished_segments = [segment for segment in segments if segment[1] < segment[2]]
+        lock = Lock()
+        stop = Event()
+        with ThreadPoolExecutor(max_workers=max(len(unfinished_segments), 1)) as executor:
+            futures = [
+                executor.submit(self._download_segment, stream, partial, segments, segment, lock, stop) 
+                for segment in unfinished_segments
+                ]
+        for future in futures:
+            # Raises the error which stopped the download, if any
+            future.result()
+        missing = sum(end - position for start, position, end in segments)
+        if missing != 0:
+            # The server ended a response early. Retried, continuing from the sidecar
+            raise IncompleteRead(b'', missing)
+        self.metrics.end_phase('transfer')
+        return partial.complete()
+
+    def _download_segment(self, stream, partial: 'PartialDownload', segments: list, segment: list, lock: Lock, stop: Event):
+        start, position, end = segment
+        try:
+            with open(partial.part_path, 'r+b') as file:
+                file.seek(position)
+                for chunk in StreamFetcher(chunk_sizer=self.chunk_sizer, metrics=self.metrics).iter_chunks(stream.url, position, end):
+                    if stop.is_set():
+                        return
+                    file.write(chunk)
+                    file.flush()
+                    with lock:
+                        segment[1] += len(chunk)
+                        self.bytes_downloaded += len(chunk)
+                        partial.save(segments)
+                        self.progress_check(stream, chunk, stream.filesize - self.bytes_downloaded)
+        except Exception:
+            # Stop the other connections as well
+            stop.set()
+            raise
+
+
+class ChunkSizer:
+    '''
+    Picks the size of the next Range request of a download from the throughput and latency measured so far.
+    Chunks are sized to take about TARGET_CHUNK_SECONDS, so fast links make fewer requests and slow ones still report progress often,
+    and are kept at least four times the size of the bytes lost waiting for the first byte.
+    Shared by all connections of one download.
+    '''
+    def __init__(self) -> None:
+        self.size = INITIAL_CHUNK_SIZE
+        self.throughput = None
+        self.latency = None
+        self.sizes = []
+        self.lock = Lock()
+
+    def next_size(self):
+        with self.lock:
+            return self.size
+
+    def record(self, size: int, latency: float, seconds: float):
+        '''Records a chunk of size bytes which took seconds in total, latency of them waiting for the response.'''
+        if size <= 0 or seconds <= 0:
+            return
+        with self.lock:
+            self.sizes.append(size)
+            throughput = size / max(seconds - latency, 0.001)
+            if self.throughput is None:
+                self.throughput, self.latency = throughput, latency
+            else:
+                # Smooth out single slow or fast chunks
+                self.throughput = 0.5 * self.throughput + 0.5 * throughput
+                self.latency = 0.5 * self.latency + 0.5 * latency
+            size = max(self.throughput * TARGET_CHUNK_SECONDS, 4 * self.throughput * self.latency)
+            size = min(max(size, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+            # Whole throttle blocks
+            self.size = int(size) // THROTTLE_BLOCK_SIZE * THROTTLE_BLOCK_SIZE
+
+    def stats(self):
+        '''Returns the chunk sizes used and the measurements behind them, e.g. for the download results.'''
+        with self.lock:
+            return {
+                'requests' : len(self.sizes),
+                'min_chunk_size' : min(self.sizes, default=0),
+                'max_chunk_size' : max(self.sizes, default=0),
+                'last_chunk_size' : self.sizes[-1] if self.sizes else 0,
+                'throughput_bps' : round(self.throughput or 0),
+                'latency_s' : round(self.latency or 0, 4)
+                }
+
+
+class StreamFetcher:
+    '''
+    Reads a stream over HTTP with one Range request per chunk, sized by the ChunkSizer.
+    Keeps to the THROTTLE limits, taking bandwidth per THROTTLE_BLOCK_SIZE bytes so the speed stays even.
+    Reports the responses and bytes to the DownloadMetrics, if given.
+    '''
+    def __init__(self, timeout: int = HTTP_TIMEOUT, chunk_sizer: 'ChunkSizer' = None, metrics: 'DownloadMetrics' = None) -> None:
+        self.timeout = timeout
+        self.chunk_sizer = chunk_sizer or ChunkSizer()
+        self.metrics = metrics
+
+    def iter_chunks(self, url: str, start: int, end: int):
+        '''Generator yielding the bytes from position start up to (not including) end.'''
+        position = start
+        while position < end:
+            chunk_size = self.chunk_sizer.next_size()
+            stop = min(position + chunk_size, end) - 1
+            headers = {'User-Agent': 'Mozilla/5.0', 'Range': f'bytes={position}-{stop}'}
+            THROTTLE.before_request()
+            started = monotonic()
+            with POOL.request('GET', url, headers, timeout=self.timeout) as response:
+                latency = monotonic() - started
+                if self.metrics is not None:
+                    self.metrics.response_started()
+                if response.status != 206:
+                    if position != 0:
+                        raise HTTPError(url, response.status, 'Range request not honoured', response.headers, None)
+                    # The whole file was sent at once
+                    while position < end:
+                        chunk = self._read(response, min(chunk_size, end - position))
+                        if not chunk:
+                            # Connection closed before the end of the file
+                            raise IncompleteRead(b'', end - position)
+                        position += len(chunk)
+                        yield chunk
+                    return
+                chunk = self._read(response, stop + 1 - position)
+                self.chunk_sizer.record(len(chunk), latency, monotonic() - started)
+            if not chunk:
+                raise HTTPError(url, response.status, 'Empty range response', response.headers, None)
+            position += len(chunk)
+            yield chunk
+
+    def _read(self, response, size: int):
+        '''Reads up to size bytes of the response, block by block as the THROTTLE allows.'''
+        blocks = []
+        while size > 0:
+            block_size = min(size, THROTTLE_BLOCK_SIZE)
+            THROTTLE.before_transfer(block_size)
+            block = response.read(block_size)
+            if not block:
+                break
+            blocks.append(block)
+            size -= len(block)
+            if self.metrics is not None:
+                self.metrics.add_bytes(len(block))
+        return b''.join(blocks)
+
+
+class PartialDownload:
+    '''
+    An incomplete download, written to "<file>.part" with a small "<file>.part.json" sidecar.
+    The sidecar records which stream the bytes belong to, 
+    and the [start, position, end] of every byte range of the file, position being how far it has been downloaded.
+    '''
+    def __init__(self, file_path: str, video_id: str, stream) -> None:
+        self.file_path = file_path
+        self.part_path = f'{file_path}.part'
+        self.sidecar_path = f'{file_path}.part.json'
+        self.identity = {
+            'video_id' : video_id,
+            'itag' : stream.itag,
+            'filesize' : stream.filesize
+            }
+
+    def resume_segments(self):
+        '''Returns the byte ranges to continue, or None if there is nothing of the same stream to continue.'''
+        try:
+            with open(self.sidecar_path) as sidecar:
+                progress = json.load(sidecar)
+            part_size = os.path.getsize(self.part_path)
+        except (OSError, ValueError):
+            return None
+        if any(progress.get(key) != value for key, value in self.identity.items()):
+            return None
+        if part_size != self.identity['filesize'] or 'segments' not in progress:
+            return None
+        return progress['segments']
+
+    def save(self, segments: list):
+        with open(self.sidecar_path, 'w') as sidecar:
+            json.dump({**self.identity, 'segments' : segments}, sidecar)
+
+    def complete(self):
+        '''Moves the finished download into place, and returns its path.'''
+        os.replace(self.part_path, self.file_path)
+        if os.path.exists(self.sidecar_path):
+            os.unlink(self.sidecar_path)
+        return self.file_path
+
+
+class VideoStore:
+    '''
+    Content-addressed store of downloaded videos, one file per video ID and resolution, 
+    kept in a STORE_DIR_NAME folder of the base save directory so it is on the same drive as the save folders.
+    The videos in the save folders are hardlinks to the stored files, or copies where hardlinks are not possible,
+    so a video in several playlists, or in a playlist and a channel, is downloaded and stored once.
+    '''
+    # A lock per stored file, shared by every VideoStore of the process
+    locks = {}
+    locks_lock = Lock()
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+
+    def path(self, video_id: str, resolution: str):
+        return str(self.directory.joinpath(video_id, f'{resolution}.mp4'))
+
+    def lock(self, video_id: str, resolution: str):
+        '''Returns the lock to hold while downloading or linking the stored file, so the same video is never downloaded twice at once.'''
+        path = self.path(video_id, resolution)
+        with VideoStore.locks_lock:
+            return VideoStore.locks.setdefault(path, Lock())
+
+    def materialize(self, stored_path: str, target_path: str):
+        '''Puts the stored file at target_path as a hardlink, or as a copy where that fails. Returns target_path.'''
+        temporary_path = f'{target_path}.link'
+        if os.path.exists(temporary_path):
+            os.unlink(temporary_path)
+        try:
+            os.link(stored_path, temporary_path)
+        except OSError:
+            # e.g. a file system without hardlinks
+            shutil.copyfile(stored_path, temporary_path)
+        os.replace(temporary_path, target_path)
+        return target_path
+
+    def prune(self):
+        '''
+        Deletes the stored videos with no hardlinks left in the save folders, e.g. after those were deleted. 
+        Partial downloads are kept. Stored files which could only be copied into the save folders are deleted too, 
+        as they would take up the disk space twice. Returns the number of bytes freed.
+        '''
+        freed = 0
+        for stored_path in self.directory.glob('*/*.mp4'):
+            lock = self.lock(stored_path.parent.name, stored_path.stem)
+            # Skip the ones being downloaded or linked right now
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                stat = stored_path.stat()
+                if stat.st_nlink == 1:
+                    stored_path.unlink()
+                    freed += stat.st_size
+                    if not any(stored_path.parent.iterdir()):
+                        stored_path.parent.rmdir()
+            except OSError:
+                continue
+            finally:
+                lock.release()
+        return freed
+
+
+class CachedVideo:
+    '''The metadata of a video, as needed for filtering and saving it, without the network requests of a YouTube object.'''
+    def __init__(self, video_id: str, title: str, author: str, publish_date: datetime, keywords: list) -> None:
+        self.video_id = video_id
+        self.watch_url = f'https://youtube.com/watch?v={video_id}'
+        self.title = title
+        self.author = author
+        self.publish_date = publish_date
+        self.keywords = keywords
+
+
+class SQLiteStore:
+    '''Base of the on-disk SQLite stores. Opens a connection per call, so one instance can be shared between worker threads.'''
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+
+class MetadataCache(SQLiteStore):
+    '''
+    On-disk SQLite cache of video metadata, keyed by video ID.
+    Entries expire after "ttl_days", and the least recently used entries are evicted once there are more than "max_entries".
+    The stream list is not cached, as the stream URLs YouTube hands out are signed and expire within hours.
+    '''
+    def __init__(self, path: Path = DATA_DIR.joinpath('metadata.sqlite3'), ttl_days: int = METADATA_CACHE_TTL_DAYS, max_entries: int = METADATA_CACHE_MAX_ENTRIES) -> None:
+        super().__init__(path)
+        self.ttl = timedelta(days=ttl_days)
+        self.max_entries = max_entries
+        self.lock = Lock()
+        with closing(self._connect()) as db, db:
+            db.execute(
+                '''CREATE TABLE IF NOT EXISTS videos (
+                    video_id TEXT PRIMARY KEY,
+                    title TEXT,
+                    author TEXT,
+                    publish_date TEXT,
+                    keywords TEXT,
+                    fetched_at TEXT,
+                    accessed_at TEXT
+                )'''
+                )
+            db.execute('CREATE INDEX IF NOT EXISTS videos_accessed_at ON videos (accessed_at)')
+            db.execute('DELETE FROM videos WHERE fetched_at < ?', ((datetime.now() - self.ttl).isoformat(),))
+
+    def get(self, video_id: str):
+        '''Returns the CachedVideo of the video ID, or None if it is not cached or has expired.'''
+        now = datetime.now()
+        with closing(self._connect()) as db, db:
+            row = db.execute(
+                'SELECT title, author, publish_date, keywords FROM videos WHERE video_id = ? AND fetched_at >= ?', 
+                (video_id, (now - self.ttl).isoformat())
+                ).fetchone()
+            if row is None:
+                return None
+            db.execute('UPDATE videos SET accessed_at = ? WHERE video_id = ?', (now.isoformat(), video_id))
+
+        title, author, publish_date, keywords = row
+        if publish_date is not None:
+            publish_date = datetime.fromisoformat(publish_date)
+        return CachedVideo(video_id, title, author, publish_date, json.loads(keywords))
+
+    def store(self, video: YouTube):
+        '''Fetches the metadata of the YouTube object, saves it in the cache and returns it as a CachedVideo.'''
+        cached_video = CachedVideo(video.video_id, video.title, video.author, video.publish_date, video.keywords)
+        now = datetime.now().isoformat()
+        publish_date = None
+        if cached_video.publish_date is not None:
+            publish_date = cached_video.publish_date.isoformat()
+
+        with self.lock, closing(self._connect()) as db, db:
+            db.execute(
+                'INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (cached_video.video_id, cached_video.title, cached_video.author, publish_date, json.dumps(cached_video.keywords), now, now)
+                )
+            # Evict the least recently used entries
+            db.execute(
+                'DELETE FROM videos WHERE video_id IN (SELECT video_id FROM videos ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+                )
+        return cached_video
+
+    def resolve(self, url: str):
+        '''Returns the CachedVideo of a video URL, only building a YouTube object and fetching its metadata if it is not cached.'''
+        cached_video = self.get(extract.video_id(url))
+        if cached_video is not None:
+            return cached_video
+        return self.store(YouTube(url))
+
+
+class MetadataResolver:
+    '''
+    Fetches the metadata of upcoming videos concurrently, while the videos are handed out one by one in their original order.
+    At most "window" videos are fetched ahead of the one being consumed. 
+    Videos already in the MetadataCache are handed out without any network requests.
+    '''
+    def __init__(self, metadata_cache: 'MetadataCache', window: int = METADATA_PREFETCH_WINDOW) -> None:
+        self.metadata_cache = metadata_cache
+        self.window = max(window, 1)
+
+    def resolve(self, urls):
+        '''
+        Generator yielding a CachedVideo per video URL, in order.
+        Closing the generator cancels the fetches which have not started yet, 
+        and throws away the results of the ones still running.
+        '''
+        for url, video, error in self.resolve_each(urls):
+            if error is not None:
+                raise error
+            yield video
+
+    def resolve_each(self, urls):
+        '''
+        Like resolve, but a video which could not be fetched does not end it: 
+        yields (url, CachedVideo, None) per video, or (url, None, exception) if fetching its metadata failed.
+        '''
+        executor = ThreadPoolExecutor(max_workers=self.window)
+        urls = iter(urls)
+        pending = deque()
+        try:
+            for url in urls:
+                pending.append((url, executor.submit(self.metadata_cache.resolve, url)))
+                if len(pending) >= self.window:
+                    break
+
+            while pending:
+                url, future = pending.popleft()
+                try:
+                    video, error = future.result(), None
+                except Exception as fetch_error:
+                    video, error = None, fetch_error
+                next_url = next(urls, None)
+                if next_url is not None:
+                    pending.append((next_url, executor.submit(self.metadata_cache.resolve, next_url)))
+                yield url, video, error
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class DownloadLedger(SQLiteStore):
+    '''
+    On-disk SQLite record of completed downloads, keyed by video ID, resolution and output path, with the size and checksum of the file.
+    Batch downloads consult it to skip videos which are already saved, without any network requests.
+    '''
+    def __init__(self, path: Path = DATA_DIR.joinpath('downloads.sqlite3')) -> None:
+        super().__init__(path)
+        self.validate = Validate()
+        with closing(self._connect()) as db, db:
+            db.execute(
+                '''CREATE TABLE IF NOT EXISTS downloads (
+                    video_id TEXT,
+                    resolution TEXT,
+                    path TEXT,
+                    size INTEGER,
+                    checksum TEXT,
+                    completed_at TEXT,
+                    PRIMARY KEY (video_id, resolution, path)
+                )'''
+                )
+            db.execute(
+                '''CREATE TABLE IF NOT EXISTS channel_watermarks (
+                    channel TEXT PRIMARY KEY,
+                    video_id TEXT,
+                    updated_at TEXT
+                )'''
+                )
+
+    def _checksum(self, path: str):
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1048576), b''):
+                sha256.update(block)
+        return sha256.hexdigest()
+
+    def record(self, video_id: str, resolution: str, path: str):
+        '''Records a completed download. The resolution is the one requested, so the same request is skipped next time.'''
+        path = str(Path(path).resolve())
+        with closing(self._connect()) as db, db:
+            db.execute(
+                'INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?)',
+                (video_id, resolution, path, os.path.getsize(path), self._checksum(path), datetime.now().isoformat())
+                )
+
+    def find(self, video_id: str, resolution: str, base_save_dir: str, subfolders: list = None, filename: str = None):
+        '''
+        Returns the path of a completed download of the video, saved in "<base_save_dir>/<author>/<subfolders>", 
+        or straight in base_save_dir if subfolders is None, which is still on disk with the recorded size. 
+        With a filename, the download must have been saved under that name. Returns None if there is none.
+        '''
+        base_save_dir = Path(base_save_dir).resolve()
+        filename = self.validate.validate_video_filename(filename)
+        with closing(self._connect()) as db:
+            rows = db.execute('SELECT path, size FROM downloads WHERE video_id = ? AND resolution = ?', (video_id, resolution)).fetchall()
+
+        for path, size in rows:
+            path = Path(path)
+            try:
+                folders = path.parent.relative_to(base_save_dir).parts
+            except ValueError:
+                continue
+            if subfolders is None:
+                if len(folders) != 0:
+                    continue
+            # The first folder is the author's
+            elif folders[1:] != tuple(self.validate.validate_subfolders(subfolders)) or len(folders) != len(subfolders) + 1:
+                continue
+            if filename is not None and path.name != filename:
+                # Saved under another name
+                continue
+            if path.is_file() and path.stat().st_size == size:
+                return str(path)
+        return None
+
+    def get_watermark(self, channel: str):
+        '''Returns the ID of the newest video downloaded from the channel, or None if the channel has not been synced.'''
+        with closing(self._connect()) as db:
+            row = db.execute('SELECT video_id FROM channel_watermarks WHERE channel = ?', (channel.lower(),)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def set_watermark(self, channel: str, video_id: str):
+        with closing(self._connect()) as db, db:
+            db.execute(
+                'INSERT OR REPLACE INTO channel_watermarks VALUES (?, ?, ?)', 
+                (channel.lower(), video_id, datetime.now().isoformat())
+                )
+
+
+class Job:
+    '''
+    A video download in the JobQueue, with everything needed to build its VideoDownloader again after a restart.
+    filename is the name to save the video as, None for its title.
+    '''
+    def __init__(self, job_id: int, batch: str, url: str, save_dir: str, subfolders: list, resolution: str, connections: int, priority: int, attempts: int, filename: str = None) -> None:
+        self.job_id = job_id
+        self.batch = batch
+        self.url = url
+        self.save_dir = save_dir
+        self.subfolders = subfolders
+        self.resolution = resolution
+        self.connections = connections
+        self.priority = priority
+        self.attempts = attempts
+        self.filename = filename
+
+
+class JobQueue(SQLiteStore):
+    '''
+    Durable on-disk SQLite queue of video downloads, grouped in batches.
+    Every job is "queued", "running", "done" or "failed", and a queued job waiting for a retry is not handed out before its next_attempt_at.
+    A batch is deleted once it has no queued or running jobs left, 
+    so the batches still in the queue on startup are the ones interrupted by the app closing, and can be resumed.
+    A batch queued while its videos are still found, e.g. by a PipelineFeed, records where they come from as its "source", 
+    and is only "fed" once every video was queued: until then it is kept, even without jobs left, so the feed can be run again.
+    '''
+    def __init__(self, path: Path = DATA_DIR.joinpath('jobs.sqlite3')) -> None:
+        super().__init__(path)
+        self.lock = Lock()
+        with closing(self._connect()) as db, db:
+            db.execute(
+                '''CREATE TABLE IF NOT EXISTS batches (
+                    batch TEXT PRIMARY KEY,
+                    title TEXT,
+                    priority INTEGER,
+                    created_at TEXT,
+                    source TEXT,
+                    fed INTEGER DEFAULT 1
+                )'''
+                )
+            if 'source' not in [column[1] for column in db.execute('PRAGMA table_info(batches)')]:
+                # Queue of an older version, its batches are all fed
+                db.execute('ALTER TABLE batches ADD COLUMN source TEXT')
+                db.execute('ALTER TABLE batches ADD COLUMN fed INTEGER DEFAULT 1')
+            db.execute(
+                '''CREATE TABLE IF NOT EXISTS jobs (
+                    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    batch TEXT,
+                    url TEXT,
+                    save_dir TEXT,
+                    subfolders TEXT,
+                    resolution TEXT,
+                    connections INTEGER,
+                    priority INTEGER,
+                    state TEXT,
+                    attempts INTEGER,
+                    next_attempt_at REAL,
+                    last_error TEXT,
+                    filename TEXT
+                )'''
+                )
+            if 'filename' not in [column[1] for column in db.execute('PRAGMA table_info(jobs)')]:
+                # Queue of an older version
+                db.execute('ALTER TABLE jobs ADD COLUMN filename TEXT')
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (batch, state, priority DESC, job_id)')
+
+    def _set_state(self, job_id: int, state: str, error: Exception = None, next_attempt_at: float = 0):
+        with closing(self._connect()) as db, db:
+            db.execute(
+                'UPDATE jobs SET state = ?, last_error = ?, next_attempt_at = ? WHERE job_id = ?', 
+                (state, None if error is None else f'{type(error).__name__}: {error}', next_attempt_at, job_id)
+                )
+
+    def add_batch(self, urls, title: str, save_dir: str, subfolders: list = None, resolution: str = None, connections: int = 1, priority: int = JOB_PRIORITY_BATCH, filenames: dict = {}, source: dict = None):
+        '''
+        Queues a download job per video URL, in order, as a new batch. Returns the ID of the batch.
+        With a source, more jobs are still to be added, and the batch is not fed until set_fed is called.
+        '''
+        batch = uuid4().hex
+        with closing(self._connect()) as db, db:
+            db.execute(
+                'INSERT INTO batches (batch, title, priority, created_at, source, fed) VALUES (?, ?, ?, ?, ?, ?)', 
+                (batch, title, priority, datetime.now().isoformat(), None if source is None else json.dumps(source), int(source is None))
+                )
+        self.add_jobs(batch, urls, save_dir, subfolders, resolution, connections, priority, filenames)
+        return batch
+
+    def add_jobs(self, batch: str, urls, save_dir: str, subfolders: list = None, resolution: str = None, connections: int = 1, priority: int = JOB_PRIORITY_BATCH, filenames: dict = {}):
+        '''Queues a download job per video URL, in order, at the end of an existing batch. filenames maps URLs to the names to save them as.'''
+        subfolders = None if subfolders is None else json.dumps(subfolders)
+        with closing(self._connect()) as db, db:
+            db.executemany(
+                'INSERT INTO jobs (batch, url, save_dir, subfolders, resolution, connections, priority, state, attempts, next_attempt_at, filename) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, 0, ?)', 
+                [(batch, url, save_dir, subfolders, resolution, connections, priority, 'queued', filenames.get(url)) for url in urls]
+                )
+
+    def claim(self, batch: str, defer_to: list = []):
+        '''
+        Marks the batch's next job as running and returns it, highest priority first, then in order. 
+        Returns None if no job is ready, or if any of the batches in defer_to has a job ready, so those go first.
+        '''
+        now = time()
+        with self.lock, closing(self._connect()) as db, db:
+            for other_batch in defer_to:
+                if db.execute('SELECT 1 FROM jobs WHERE batch = ? AND state = ? AND next_attempt_at <= ?', (other_batch, 'queued', now)).fetchone():
+                    return None
+            row = db.execute(
+                '''SELECT job_id, batch, url, save_dir, subfolders, resolution, connections, priority, attempts, filename FROM jobs 
+                WHERE batch = ? AND state = ? AND next_attempt_at <= ? ORDER BY priority DESC, job_id LIMIT 1''', 
+                (batch, 'queued', now)
+                ).fetchone()
+            if row is None:
+                return None
+            db.execute('UPDATE jobs SET state = ?, attempts = attempts + 1 WHERE job_id = ?', ('running', row[0]))
+
+        job_id, batch, url, save_dir, subfolders, resolution, connections, priority, attempts, filename = row
+        if subfolders is not None:
+            subfolders = json.loads(subfolders)
+        return Job(job_id, batch, url, save_dir, subfolders, resolution, connections, priority, attempts + 1, filename)
+
+    def complete(self, job_id: int):
+        self._set_state(job_id, 'done')
+
+    def fail(self, job_id: int, error: Exception):
+        self._set_state(job_id, 'failed', error)
+
+    def retry(self, job_id: int, error: Exception, delay: float):
+        '''Queues the job again, to be handed out after delay seconds.'''
+        self._set_state(job_id, 'queued', error, time() + delay)
+
+    def release(self, job_id: int):
+        '''Queues a job which was stopped before it finished, without counting the attempt.'''
+        with closing(self._connect()) as db, db:
+            db.execute('UPDATE jobs SET state = ?, attempts = attempts - 1 WHERE job_id = ?', ('queued', job_id))
+
+    def next_ready_in(self, batch: str):
+        '''Returns the seconds until the batch's next queued job may be handed out, or None if it has no queued jobs.'''
+        with closing(self._connect()) as db:
+            next_attempt_at = db.execute('SELECT MIN(next_attempt_at) FROM jobs WHERE batch = ? AND state = ?', (batch, 'queued')).fetchone()[0]
+        if next_attempt_at is None:
+            return None
+        return max(next_attempt_at - time(), 0)
+
+    def counts(self, batch: str):
+        '''Returns the number of jobs of the batch in each state.'''
+        with closing(self._connect()) as db:
+            return dict(db.execute('SELECT state, COUNT(*) FROM jobs WHERE batch = ? GROUP BY state', (batch,)).fetchall())
+
+    def get_priority(self, batch: str):
+        with closing(self._connect()) as db:
+            row = db.execute('SELECT priority FROM batches WHERE batch = ?', (batch,)).fetchone()
+        return JOB_PRIORITY_BATCH if row is None else row[0]
+
+    def get_source(self, batch: str):
+        '''Returns the source of a batch which is not fed yet, or None if every video of the batch was queued.'''
+        with closing(self._connect()) as db:
+            row = db.execute('SELECT source FROM batches WHERE batch = ? AND fed = 0', (batch,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def set_fed(self, batch: str):
+        '''Records that every video of the batch was queued.'''
+        with closing(self._connect()) as db, db:
+            db.execute('UPDATE batches SET fed = 1 WHERE batch = ?', (batch,))
+
+    def urls(self, batch: str):
+        '''Returns the URLs queued in the batch so far, whatever the state of their jobs.'''
+        with closing(self._connect()) as db:
+            return [row[0] for row in db.execute('SELECT url FROM jobs WHERE batch = ? ORDER BY job_id', (batch,))]
+
+    def unfinished_batches(self):
+        '''
+        Returns the [batch ID, title, jobs left, fed] of every batch with queued or running jobs, 
+        or which is not fed yet, oldest first.
+        '''
+        with closing(self._connect()) as db:
+            return [[batch, title, jobs_left, bool(fed)] for batch, title, jobs_left, fed in db.execute(
+                '''SELECT batches.batch, title, COUNT(jobs.job_id), fed FROM batches 
+                LEFT JOIN jobs ON jobs.batch = batches.batch AND state IN ('queued', 'running') 
+                GROUP BY batches.batch HAVING COUNT(jobs.job_id) > 0 OR fed = 0 ORDER BY created_at'''
+                )]
+
+    def recover(self, batch: str):
+        '''Queues the jobs left running when the app closed, so they are resumed. Their partial downloads continue where they stopped.'''
+        with closing(self._connect()) as db, db:
+            db.execute('UPDATE jobs SET state = ?, attempts = attempts - 1 WHERE batch = ? AND state = ?', ('queued', batch, 'running'))
+
+    def finish(self, batch: str):
+        '''Deletes the batch if it is fed, and has no queued or running jobs left.'''
+        with closing(self._connect()) as db, db:
+            if db.execute('SELECT 1 FROM batches WHERE batch = ? AND fed = 0', (batch,)).fetchone() is not None:
+                return
+            if db.execute("SELECT 1 FROM jobs WHERE batch = ? AND state IN ('queued', 'running')", (batch,)).fetchone() is None:
+                db.execute('DELETE FROM jobs WHERE batch = ?', (batch,))
+                db.execute('DELETE FROM batches WHERE batch = ?', (batch,))
+
+    def discard(self, batch: str):
+        with closing(self._connect()) as db, db:
+            db.execute('DELETE FROM jobs WHERE batch = ?', (batch,))
+            db.execute('DELETE FROM batches WHERE batch = ?', (batch,))
+
+
+class RetryPolicy:
+    '''Decides which failed downloads are retried, and after how long: exponential backoff with jitter.'''
+    def __init__(self, max_attempts: int = JOB_MAX_ATTEMPTS, base_seconds: float = JOB_RETRY_BASE_SECONDS, max_seconds: float = JOB_RETRY_MAX_SECONDS) -> None:
+        self.max_attempts = max_attempts
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+
+    def is_throttling(self, error: Exception):
+        '''
+        Whether the server is refusing requests because of their rate.
+        A 403 is not counted: it usually means an expired or unplayable stream URL, 
+        which the retry fetches again, and a persistent one would keep the breaker tripping.
+        '''
+        return isinstance(error, HTTPError) and error.code == 429
+
+    def is_retryable(self, error: Exception):
+        if isinstance(error, HTTPError):
+            return error.code in (403, 408, 429, 500, 502, 503, 504)
+        # Connection errors and timeouts
+        return isinstance(error, (OSError, HTTPException))
+
+    def should_retry(self, error: Exception, attempts: int):
+        return attempts < self.max_attempts and self.is_retryable(error)
+
+    def delay(self, attempts: int):
+        '''Seconds to wait before the next attempt, after the given number of attempts.'''
+        delay = min(self.base_seconds * 2 ** (attempts - 1), self.max_seconds)
+        # Jitter, so the retries of a batch do not all hit the server at once
+        return delay * random.uniform(0.5, 1.5)
+
+
+class CircuitBreaker:
+    '''
+    Pauses every download worker in the process after "threshold" throttling errors in a row, for "cooldown" seconds.
+    The cooldown doubles each time the breaker trips again before any download succeeded, up to "max_cooldown".
+    Used through the BREAKER instance below.
+    '''
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN_SECONDS, max_cooldown: float = BREAKER_MAX_COOLDOWN_SECONDS) -> None:
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0
+        self.lock = Lock()
+
+    def record_throttled(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.open_until = monotonic() + self.cooldown
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self.failures = 0
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+
+    def wait(self, stop: Event):
+        '''Blocks while the breaker is open, or until stop is set. Returns the seconds waited.'''
+        waited = 0
+        while not stop.is_set():
+            with self.lock:
+                remaining = self.open_until - monotonic()
+            if remaining <= 0:
+                break
+            stop.wait(min(remaining, 1))
+            waited += min(remaining, 1)
+        return waited
+
+
+BREAKER = CircuitBreaker()
+
+
+class JobProgress:
+    '''
+    Stands in for the progress reporter of a single VideoDownloader run by the DownloadEngine.
+    Keeps track of the job's own progress, and lets the engine report it along with the rest of the batch.
+    '''
+    def __init__(self, engine, job_id: int) -> None:
+        self.engine = engine
+        self.job_id = job_id
+        self.video_name = 'Video: ...'
+        self.percent = 0.0
+
+    def update_video_name(self, name: str):
+        self.video_name = name
+
+    def update_progress(self, percent: float):
+        if self.engine.stopped.is_set():
+            # Let the VideoDownloader stop, the same way as when its own progress window is closed
+            raise DownloadCancelled('Download batch stopped')
+        self.percent = percent
+        self.engine.report_progress()
+
+
+class DownloadEngine:
+    '''
+    Downloads a batch of the JobQueue with a bounded pool of worker threads, running up to "workers" VideoDownloaders at once.
+    Failed downloads are retried as the RetryPolicy allows, and all workers pause while the BREAKER is open.
+    While batches of a higher priority run in the same process, their jobs are started first.
+    The progress bar shows the aggregate progress of the batch, and a line per running download.
+    A PipelineFeed may add jobs to the batch while it downloads, at most max_queued of them waiting for a worker at a time.
+    '''
+    # Priority of every batch being run in this process
+    running_batches = {}
+    running_batches_lock = Lock()
+
+    def __init__(self, workers: int = DEFAULT_DOWNLOAD_WORKERS, ledger: 'DownloadLedger' = None, queue: 'JobQueue' = None, retry_policy: 'RetryPolicy' = None, max_queued: int = PIPELINE_QUEUED_JOBS) -> None:
+        self.workers = max(workers, 1)
+        self.ledger = ledger
+        self.queue = queue or JobQueue()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.max_queued = max(max_queued, 1)
+        self.lock = Lock()
+        # Notified whenever a job is queued or handed out
+        self.room = Condition(self.lock)
+        self.stopped = Event()
+        self.progress_bar = None
+        self.batch = None
+        self.priority = JOB_PRIORITY_BATCH
+        self.jobs = {}
+        self.downloaded = []
+        self.failed = []
+        self.completed = 0
+        self.total = 0
+        # Jobs waiting for a worker, including the ones waiting for a retry
+        self.queued = 0
+        self.feed = None
+        self.feeding = False
+        self.feed_error = None
+        # Stopped by the user, rather than by the app closing
+        self.cancelled = False
+
+    def run(self, batch: str, build_downloader, progress_bar: 'ProgressReporter', feed: 'PipelineFeed' = None):
+        '''
+        Downloads every queued job of the batch, where build_downloader(job) returns the VideoDownloader for it.
+        build_downloader is called from the worker thread, so any metadata it needs is fetched in parallel too.
+        With a feed, feed.run(self) runs in a thread of its own next to the workers, adding jobs with add_jobs,
+        and the workers wait for more jobs until it returns. An exception of the feed is kept in feed_error.
+        Returns False if the batch was stopped, otherwise True. 
+        A batch cancelled by the user is discarded, one interrupted by the app closing stays in the queue.
+        '''
+        self.batch = batch
+        self.priority = self.queue.get_priority(batch)
+        self.progress_bar = progress_bar
+        counts = self.queue.counts(batch)
+        self.total = sum(counts.values())
+        self.completed = counts.get('done', 0) + counts.get('failed', 0)
+        self.queued = counts.get('queued', 0)
+        self.feed = feed
+        self.feeding = feed is not None
+        if self.feeding:
+            # How many videos there are is only known once the feed is done
+            self.progress_bar.set_job_slots(self.workers)
+        else:
+            self.progress_bar.set_job_slots(max(min(self.workers, self.total - self.completed), 1))
+        self.report_progress()
+
+        with DownloadEngine.running_batches_lock:
+            DownloadEngine.running_batches[batch] = self.priority
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers + self.feeding) as executor:
+                if self.feeding:
+                    executor.submit(self._feed)
+                for _ in range(self.workers):
+                    executor.submit(self._work, build_downloader)
+        finally:
+            with DownloadEngine.running_batches_lock:
+                del DownloadEngine.running_batches[batch]
+            if self.cancelled:
+                self.queue.discard(batch)
+            else:
+                self.queue.finish(batch)
+        return not self.stopped.is_set()
+
+    def _feed(self):
+        '''The feeding thread: runs the feed, then lets the workers finish once nothing is left to start.'''
+        try:
+            self.feed.run(self)
+        except Exception as error:
+            # The jobs queued so far are still downloaded
+            self.feed_error = error
+        finally:
+            with self.room:
+                self.feeding = False
+                self.room.notify_all()
+            self.report_progress()
+
+    def add_jobs(self, urls: list, save_dir: str, subfolders: list = None, resolution: str = None, connections: int = 1, filenames: dict = {}):
+        '''
+        Called by the feed. Waits until fewer than max_queued jobs are waiting for a worker, then queues the videos in the batch. 
+        Returns False without queuing them if the batch was stopped.
+        '''
+        with self.room:
+            while self.queued >= self.max_queued and not self.stopped.is_set():
+                self.room.wait(0.5)
+        if self.stopped.is_set():
+            return False
+        self.queue.add_jobs(self.batch, urls, save_dir, subfolders, resolution, connections, self.priority, filenames)
+        with self.room:
+            self.queued += len(urls)
+            self.total += len(urls)
+            self.room.notify_all()
+        self.report_progress()
+        return True
+
+    def _queued_change(self, change: int):
+        with self.room:
+            self.queued += change
+            self.room.notify_all()
+
+    def _wait_for_jobs(self):
+        '''Waits while the feed may still queue jobs. Returns False once it is done, and nothing is left to start.'''
+        with self.room:
+            if self.feeding:
+                if self.queued == 0:
+                    self.room.wait(1)
+                return True
+        # The feed may have queued its last jobs since the queue was checked
+        return self.queue.next_ready_in(self.batch) is not None
+
+    def _higher_priority_batches(self):
+        with DownloadEngine.running_batches_lock:
+            return [batch for batch, priority in DownloadEngine.running_batches.items() if priority > self.priority]
+
+    def _work(self, build_downloader):
+        '''A worker thread: downloads jobs of the batch until none are left, or the batch is stopped.'''
+        while not self.stopped.is_set():
+            if BREAKER.wait(self.stopped):
+                # Paused because of throttling
+                continue
+            job = self.queue.claim(self.batch, self._higher_priority_batches())
+            if job is not None:
+                self._queued_change(-1)
+                self._download(job, build_downloader)
+                continue
+            ready_in = self.queue.next_ready_in(self.batch)
+            if ready_in is not None:
+                self.stopped.wait(min(max(ready_in, 0.1), 1))
+            elif not self._wait_for_jobs():
+                # Nothing left to start, the jobs still running are retried by their own worker if needed
+                return
+
+    def _download(self, job: Job, build_downloader):
+        progress = JobProgress(self, job.job_id)
+        with self.lock:
+            self.jobs[job.job_id] = progress
+        finished = True
+        status, error = 'completed', None
+        downloader = None
+        try:
+            downloader = build_downloader(job)
+            downloader.set_progress_bar(progress)
+            downloader.download_video()
+            self.queue.complete(job.job_id)
+            BREAKER.record_success()
+            if downloader.output_path is not None:
+                self.downloaded.append({
+                    'url' : job.url, 
+                    'path' : str(downloader.output_path), 
+                    'resolution' : downloader.resolution, 
+                    'available_resolutions' : downloader.available_resolutions, 
+                    'chunks' : downloader.chunk_sizer.stats(),
+                    'from_store' : downloader.from_store
+                    })
+                if self.ledger is not None:
+                    self.ledger.record(downloader.video_id, downloader.requested_resolution, downloader.output_path)
+        except RuntimeError as stop_error:
+            # Download was stopped, don't start the rest of the batch
+            self.queue.release(job.job_id)
+            self._queued_change(1)
+            finished = False
+            self.stopped.set()
+            status, error = 'stopped', stop_error
+        except Exception as download_error:
+            # A single broken video should not abort the whole batch
+            error = download_error
+            if self.retry_policy.is_throttling(error):
+                BREAKER.record_throttled()
+            if self.retry_policy.should_retry(error, job.attempts):
+                self.queue.retry(job.job_id, error, self.retry_policy.delay(job.attempts))
+                self._queued_change(1)
+                finished = False
+                status = 'retrying'
+            else:
+                self.queue.fail(job.job_id, error)
+                self.failed.append((job.url, error))
+                status = 'failed'
+        finally:
+            with self.lock:
+                del self.jobs[job.job_id]
+                if finished:
+                    self.completed += 1
+            self.report_progress()
+        self._record_metrics(job, downloader, status, error)
+
+    def _record_metrics(self, job: Job, downloader: 'VideoDownloader', status: str, error: Exception = None):
+        '''Hands the metrics of the download attempt, with its outcome, to METRICS.'''
+        metrics = DownloadMetrics(job.url).to_dict() if downloader is None else downloader.metrics.to_dict()
+        resolution = None if downloader is None else downloader.chosen_resolution
+        metrics.update({
+            'batch' : job.batch,
+            'job_id' : job.job_id,
+            'status' : status,
+            'error' : None if error is None else str(error),
+            'attempt' : job.attempts,
+            'retries' : job.attempts - 1,
+            'requested_resolution' : job.resolution,
+            'resolution' : resolution,
+            'downgraded' : resolution is not None and resolution != job.resolution
+            })
+        try:
+            METRICS.record(metrics)
+        except OSError:
+            # Metrics are not worth failing a download over
+            pass
+
+    def report_progress(self):
+        '''Updates the progress bar with the aggregate progress and the progress of every running job.'''
+        if self.stopped.is_set():
+            return
+        with self.lock:
+            jobs = sorted(self.jobs.values(), key=lambda job: job.job_id)
+            completed = self.completed
+            total_percent = (100 * completed + sum(job.percent for job in jobs)) / max(self.total, 1)
+            job_lines = [f'{job.video_name} ({job.percent:.1f}%)' for job in jobs]
+            total = self.total
+            # Until the feed queues the first job, the status it was started with stays
+            show_status = total > 0 or not self.feeding
+            stages = None
+            if self.feed is not None:
+                stages = self.feed.stages() + [('Queued', self.queued, self.max_queued), ('Downloading', len(jobs), self.workers)]
+        try:
+            if show_status:
+                self.progress_bar.update_status_batch(completed, len(jobs), total)
+            self.progress_bar.update_jobs(job_lines)
+            self.progress_bar.update_progress(total_percent)
+            if stages is not None:
+                self.progress_bar.update_pipeline(stages)
+        except DownloadCancelled as error:
+            # Progress window was closed
+            if not isinstance(error, DownloadInterrupted):
+                self.cancelled = True
+            self.stopped.set()
+
+
+class Validate:
+    def _delete_special_chars(self, text: str):
+        special_chars = ['\\', '/', '|', ':', '&', '*', '?', '>', '<']
+        for char in special_chars:
+            text = text.replace(char, '')
+        return text
+
+    def validate_filename(self, filename: str):
+        return self._delete_special_chars(filename).replace('"', '').strip()
+
+    def validate_video_filename(self, filename: str):
+        '''Returns the file name to save a video as, with its .mp4 extension, or None to use its title.'''
+        if filename is None:
+            return None
+        filename = self.validate_filename(filename)
+        if filename == '':
+            return None
+        if not filename.endswith('.mp4'):
+            filename += '.mp4'
+        return filename
+
+    def validate_subfolders(self, subfolders: list):
+        validated_subfolders = []
+        for subfolder in subfolders:
+            validated_subfolders.append(self._delete_special_chars(subfolder))
+        return validated_subfolders
+
+    def validate_save_directory(self, base_save_dir: str, subfolders: list = []):
+        validated_subfolders = '/'.join(self.validate_subfolders(subfolders))
+        path = Path(base_save_dir).joinpath(validated_subfolders)
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+    
+    def validate_channel_name(self, channel_name: str):
+        '''
+        Returns a string without whitespace.
+        To prevent user from downloading the wrong channel, e.g. the channel 'tech', when searching for channel name 'tech tips'.
+        '''
+        return channel_name.replace(' ', '').strip()
+
+
+class VideoList:
+    '''
+    Video URLs given in bulk, pasted or read from a text or CSV file. One video per line, 
+    optionally followed by the file name to save it as, separated by a comma, semicolon or tab.
+    Each line is split on its first comma, semicolon or tab, so a file name may contain the other ones.
+    Blank lines, lines starting with # and a header row are ignored.
+    A video given more than once, under any form of its URL, is kept once, with the first file name given for it.
+    "entries" holds the (URL, file name or None) per video, "invalid" the lines without a video URL.
+    '''
+    def __init__(self, text: str) -> None:
+        self.entries = []
+        self.invalid = []
+        self.duplicates = 0
+        # Index in entries by video ID
+        video_ids = {}
+        for line in text.splitlines():
+            if line.strip() == '' or line.strip().startswith('#'):
+                continue
+            cells = [cell.strip() for cell in re.split('[,;\t]', line, maxsplit=1)]
+            if len(cells) > 1 and len(cells[1]) > 1 and cells[1][0] == cells[1][-1] == '"':
+                # Quoted, as spreadsheets export names with commas
+                cells[1] = cells[1][1:-1].replace('""', '"').strip()
+            if cells[0] == '':
+                continue
+            try:
+                video_id = extract.video_id(cells[0])
+            except exceptions.RegexMatchError:
+                if len(self.entries) + len(self.invalid) > 0 or 'url' not in cells[0].lower():
+                    self.invalid.append(line.strip())
+                continue
+            filename = cells[1] if len(cells) > 1 and cells[1] != '' else None
+            if video_id in video_ids:
+                self.duplicates += 1
+                url, first_filename = self.entries[video_ids[video_id]]
+                if first_filename is None:
+                    self.entries[video_ids[video_id]] = (url, filename)
+                continue
+            video_ids[video_id] = len(self.entries)
+            self.entries.append((f'https://www.youtube.com/watch?v={video_id}', filename))
+
+    def urls(self):
+        return [url for url, filename in self.entries]
+
+    def filenames(self):
+        '''Returns the file names given, by URL.'''
+        return {url : filename for url, filename in self.entries if filename is not None}
+
+
+class VideoEnumerator:
+    '''
+    Hands out the video URLs of a playlist or channel as its pages come in, e.g. to check whether it has any videos 
+    without reading past the first page. Unlike pytube's video_urls and videos lists, it keeps no page it has handed out, 
+    and builds no YouTube objects.
+    Can be iterated once.
+    '''
+    def __init__(self, playlist: Playlist, until_video_id: str = None) -> None:
+        self.playlist = playlist
+        self.until_video_id = until_video_id
+        self._page_iterator = None
+        self._first_page = None
+
+    def _next_page(self):
+        if self._page_iterator is None:
+            self._page_iterator = self.playlist._paginate()
+        return next(self._page_iterator, None)
+
+    def is_empty(self):
+        '''Returns True if the playlist or channel has no videos at all. Only requests its first page.'''
+        if self._first_page is None:
+            self._first_page = self._next_page() or []
+        return len(self._first_page) == 0
+
+    def __iter__(self):
+        if self._first_page is None:
+            self.is_empty()
+        page, self._first_page = self._first_page, []
+        while page:
+            for watch_path in page:
+                if self.until_video_id is not None and watch_path == f'/watch?v={self.until_video_id}':
+                    # Stops before requesting any further page
+                    return
+                yield self.playlist._video_url(watch_path)
+            page = self._next_page()
+
+
+class KeywordMatcher:
+    '''
+    The keywords given by the user, parsed once into a matcher for the videos of a channel.
+    A keyword matches a video if it is one of the keywords set by the video, or is part of its title, ignoring case.
+    Keywords may contain spaces, and are combined with commas or OR, with AND, and with NOT, e.g. 
+    "news, sport", "review AND NOT unboxing" or "(cpu OR gpu) AND benchmark". 
+    Only the uppercase words are operators. Keywords in double quotes are taken as they are, e.g. "\"AND\"".
+    No keywords match every video.
+    '''
+    TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|(,)|"([^"]*)"?|([^\s(),"]+))')
+
+    def __init__(self, expression: str = '') -> None:
+        self.expression = expression
+        self.tokens = self._tokenize(expression)
+        self.position = 0
+        tree = self._parse_or()
+        if self.position < len(self.tokens):
+            raise InvalidKeywordsError(f'Unexpected "{self.tokens[self.position][1]}" in keywords: {expression}')
+
+        self.match_all = tree is None
+        # Any of a few keywords, the usual case, is matched with one regex search of the title
+        if tree is not None and tree[0] == 'or' and all(node[0] == 'term' for node in tree[1:]):
+            tree = ('terms', [node[1] for node in tree[1:]])
+        self._test = None if tree is None else self._compile(tree)
+
+    def _normalize(self, text: str):
+        return ' '.join(text.casefold().split())
+
+    def _tokenize(self, expression: str):
+        '''Splits the expression into (kind, text) tokens: "(", ")", "or", "and", "not" and "word".'''
+        tokens = []
+        for open_paren, close_paren, comma, quoted, word in self.TOKEN_PATTERN.findall(expression):
+            if open_paren or close_paren:
+                tokens.append((open_paren or close_paren, open_paren or close_paren))
+            elif comma or word == 'OR':
+                tokens.append(('or', comma or word))
+            elif word in ('AND', 'NOT'):
+                tokens.append((word.lower(), word))
+            elif quoted or word:
+                tokens.append(('word', quoted or word))
+        return tokens
+
+    def _peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][0]
+        return None
+
+    def _parse_or(self):
+        # Empty alternatives, e.g. of a trailing comma, are left out
+        alternatives = []
+        while self._peek() not in (None, ')'):
+            if self._peek() == 'or':
+                self.position += 1
+                continue
+            alternatives.append(self._parse_and())
+        if not alternatives:
+            return None
+        return ('or', *alternatives)
+
+    def _parse_and(self):
+        operands = [self._parse_not()]
+        while self._peek() == 'and':
+            self.position += 1
+            operands.append(self._parse_not())
+        if len(operands) == 1:
+            return operands[0]
+        return ('and', *operands)
+
+    def _parse_not(self):
+        if self._peek() == 'not':
+            self.position += 1
+            return ('not', self._parse_not())
+        if self._peek() == '(':
+            self.position += 1
+            tree = self._parse_or()
+            if tree is None or self._peek() != ')':
+                raise InvalidKeywordsError(f'Unbalanced or empty brackets in keywords: {self.expression}')
+            self.position += 1
+            return tree
+        words = []
+        while self._peek() == 'word':
+            words.append(self.tokens[self.position][1])
+            self.position += 1
+        term = self._normalize(' '.join(words))
+        if not term:
+            raise InvalidKeywordsError(f'Missing keyword in keywords: {self.expression}')
+        return ('term', term)
+
+    def _compile(self, tree):
+        '''Turns the parsed expression into a function of a normalized title and set of keywords.'''
+        kind = tree[0]
+        if kind == 'terms':
+            terms = set(tree[1])
+            title_pattern = re.compile('|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)))
+            return lambda title, keywords: not terms.isdisjoint(keywords) or title_pattern.search(title) is not None
+        if kind == 'term':
+            term = tree[1]
+            return lambda title, keywords: term in keywords or term in title
+        if kind == 'not':
+            test = self._compile(tree[1])
+            return lambda title, keywords: not test(title, keywords)
+        tests = [self._compile(node) for node in tree[1:]]
+        if len(tests) == 1:
+            return tests[0]
+        if kind == 'and':
+            return lambda title, keywords: all(test(title, keywords) for test in tests)
+        return lambda title, keywords: any(test(title, keywords) for test in tests)
+
+    def matches(self, title: str, keywords: list):
+        '''Returns True if a video with this title and these keywords matches.'''
+        if self.match_all:
+            return True
+        return self._test(self._normalize(title or ''), {keyword.casefold().strip() for keyword in keywords or []})
+
+
+class ChannelFilter:
+    '''The timeframe and keyword requirements of a channel download.'''
+    def __init__(self, metadata_cache: MetadataCache, timeframe: str = 'All Time', keywords: str = '') -> None:
+        self.metadata_cache = metadata_cache
+        self.timeframe = timeframe
+        self.keywords = keywords
+        self.keyword_matcher = KeywordMatcher(keywords)
+
+    def video_within_timeframe(self, video: CachedVideo):
+        '''
+        Returns True if video has been publishing within the given timeframe.
+        Always returns True if the given timeframe is "All Time".
+        '''
+        if self.timeframe == 'All Time':
+            return True
+
+        days_since_upload = (datetime.today() - video.publish_date).days
+        if days_since_upload <= TIMEFRAME_OPTIONS[self.timeframe]:
+            return True
+        else:
+            return False      
+
+    def video_match_keywords(self, video: CachedVideo):
+        '''Returns True if the video matches the keywords given by the user, see KeywordMatcher. Always True without keywords.'''
+        return self.keyword_matcher.matches(video.title, video.keywords)
+
+    def filter_channel_videos(self, videos: VideoEnumerator):
+        '''
+        Return a list of CachedVideo objects which, 
+        matches any timeframe,  
+        and contains the keywords given, if any.
+
+        Keyword searches returns True if
+        keyword is found in the keywords given by the author, 
+        or in the the video title.
+
+        Since video keywords may contain sentences, 
+        keywords given by the user will only be seperated by commas (,), OR, AND and NOT. 
+
+        The channel's videos are read page by page, and no further pages are requested once the timeframe is passed, 
+        or once the enumerator's until_video_id is reached.
+        '''
+        resolver = MetadataResolver(self.metadata_cache, METADATA_PREFETCH_WINDOW)
+        with closing(resolver.resolve(videos)) as resolved_videos:
+            # Leaving the resolver cancels the metadata fetches still in flight
+            return list(self.select(resolved_videos))
+
+    def select(self, videos):
+        '''Generator of the videos which meet the requirements, out of the channel's CachedVideos, newest first.'''
+        for video in videos:
+            if self.video_within_timeframe(video):
+                if self.video_match_keywords(video):
+                    yield video
+            else:
+                # the channel.videos list is ordered by newest first, 
+                # so if timeframe does not match once, the following won't match either.
+                return
+
+
+class PlaylistDiscovery:
+    '''
+    Finds the playlists of a channel over plain HTTP, without a browser.
+    Reads the initial data JSON embedded in the channel's playlists page, and follows its continuation pages.
+    base_url can point at a local server, e.g. one serving saved pages.
+    '''
+    def __init__(self, base_url: str = YOUTUBE_URL, timeout: int = HTTP_TIMEOUT) -> None:
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.headers = {
+            'User-Agent' : 'Mozilla/5.0',
+            'Accept-Language' : 'en-US,en',
+            # Accepts the cookie consent up front, instead of being redirected to consent.youtube.com
+            'Cookie' : 'CONSENT=YES+cb; SOCS=CAI'
+            }
+
+    def _get(self, url: str):
+        THROTTLE.before_request()
+        with POOL.request('GET', url, self.headers, timeout=self.timeout) as response:
+            return response.read().decode('utf-8')
+
+    def _post(self, url: str, data: dict):
+        headers = {**self.headers, 'Content-Type' : 'application/json'}
+        THROTTLE.before_request()
+        with POOL.request('POST', url, headers, json.dumps(data).encode('utf-8'), self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def _walk(self, data, playlists: list, continuations: list):
+        '''Collects the playlists and continuation tokens found anywhere in the JSON data, in page order.'''
+        if isinstance(data, list):
+            for item in data:
+                self._walk(item, playlists, continuations)
+            return
+        if not isinstance(data, dict):
+            return
+
+        for key, value in data.items():
+            if key in ('gridPlaylistRenderer', 'playlistRenderer') and 'playlistId' in value:
+                title = value.get('title', {})
+                title = title.get('simpleText') or ''.join(run.get('text', '') for run in title.get('runs', []))
+                playlists.append([title, value['playlistId']])
+            elif key == 'lockupViewModel' and value.get('contentType') == 'LOCKUP_CONTENT_TYPE_PLAYLIST':
+                title = value.get('metadata', {}).get('lockupMetadataViewModel', {}).get('title', {}).get('content', '')
+                playlists.append([title, value['contentId']])
+            elif key == 'continuationItemRenderer':
+                token = value.get('continuationEndpoint', {}).get('continuationCommand', {}).get('token')
+                if token is not None:
+                    continuations.append(token)
+            else:
+                self._walk(value, playlists, continuations)
+
+    def parse_page(self, data: dict):
+        '''Returns the [title, playlist ID] pairs and the continuation tokens found in the JSON data of a page.'''
+        playlists = []
+        continuations = []
+        self._walk(data, playlists, continuations)
+        return playlists, continuations
+
+    def get_playlists(self, channel_name: str):
+        '''Returns a [title, playlist URL] pair for every playlist of the channel.'''
+        html = self._get(f'{self.base_url}/c/{quote(channel_name)}/playlists')
+        try:
+            page_data = extract.initial_data(html)
+        except exceptions.RegexMatchError:
+            # Not a channel page
+            return []
+        try:
+            api_key = extract.get_ytcfg(html).get('INNERTUBE_API_KEY')
+        except exceptions.RegexMatchError:
+            api_key = None
+
+        found_playlists, continuations = self.parse_page(page_data)
+        seen_tokens = set()
+        while continuations and api_key is not None:
+            token = continuations.pop(0)
+            if token in seen_tokens:
+                continue
+            seen_tokens.add(token)
+            page_data = self._post(
+                f'{self.base_url}/youtubei/v1/browse?key={api_key}', 
+                {'context' : {'client' : INNERTUBE_CLIENT}, 'continuation' : token}
+                )
+            more_playlists, more_continuations = self.parse_page(page_data)
+            found_playlists += more_playlists
+            continuations += more_continuations
+
+        playlists = []
+        seen_ids = set()
+        for title, playlist_id in found_playlists:
+            if playlist_id not in seen_ids:
+                seen_ids.add(playlist_id)
+                playlists.append([title, f'{self.base_url}/playlist?list={playlist_id}'])
+        return playlists
+
+
+class PlaylistMatch:
+    '''A playlist found by PlaylistCatalog.search, with how well its title matches the query, from 0 to 1.'''
+    def __init__(self, title: str, url: str, score: float) -> None:
+        self.title = title
+        self.url = url
+        self.score = score
+
+
+class PlaylistIndex:
+    '''
+    In-memory search index over the playlist titles of a channel.
+    Maps every character trigram and every word of the titles to the playlists containing it, 
+    so a query only scores the playlists sharing at least one trigram with it.
+    '''
+    def __init__(self, playlists: list) -> None:
+        self.playlists = playlists
+        self.trigrams = []
+        self.tokens = []
+        self.trigram_index = {}
+        self.token_index = {}
+        for position, (title, url) in enumerate(playlists):
+            trigrams = self._trigrams(title)
+            tokens = self._tokens(title)
+            self.trigrams.append(trigrams)
+            self.tokens.append(tokens)
+            for trigram in trigrams:
+                self.trigram_index.setdefault(trigram, []).append(position)
+            for token in tokens:
+                self.token_index.setdefault(token, []).append(position)
+        # Sorted, so the words starting with a query word are found by bisection
+        self.vocabulary = sorted(self.token_index)
+
+    def _normalize(self, text: str):
+        return ' '.join(re.sub(r'[\W_]+', ' ', text.casefold()).split())
+
+    def _trigrams(self, text: str):
+        padded = f' {self._normalize(text)} '
+        return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+    def _tokens(self, text: str):
+        return set(self._normalize(text).split())
+
+    def search(self, query: str, limit: int = PLAYLIST_SUGGESTIONS, min_score: float = PLAYLIST_MATCH_MIN_SCORE):
+        '''
+        Returns the best "limit" PlaylistMatches for the query, best first.
+        The score is mostly the Dice coefficient of the trigrams of the query and the title, 
+        plus the share of the query's words which start a word of the title. Identical titles score 1.
+        '''
+        query_trigrams = self._trigrams(query)
+        query_tokens = self._tokens(query)
+        if not query_trigrams or not query_tokens:
+            return []
+
+        shared_trigrams = Counter()
+        for trigram in query_trigrams:
+            shared_trigrams.update(self.trigram_index.get(trigram, ()))
+        shared_tokens = Counter()
+        for token in query_tokens:
+            positions = set()
+            for word in self.vocabulary[bisect_left(self.vocabulary, token):]:
+                if not word.startswith(token):
+                    break
+                positions.update(self.token_index[word])
+            shared_tokens.update(positions)
+
+        matches = []
+        for position, shared in shared_trigrams.items():
+            dice = 2 * shared / (len(query_trigrams) + len(self.trigrams[position]))
+            score = 0.75 * dice + 0.25 * shared_tokens[position] / len(query_tokens)
+            if score >= min_score:
+                matches.append((-score, position))
+
+        # Ties keep the channel's own playlist order
+        matches.sort()
+        return [
+            PlaylistMatch(self.playlists[position][0], self.playlists[position][1], round(-score, 4)) 
+            for score, position in matches[:limit]
+            ]
+
+
+class PlaylistCatalog(SQLiteStore):
+    '''
+    On-disk SQLite catalog of the playlists of each channel, as found by PlaylistDiscovery.
+    A channel's catalog is fetched again after "ttl_hours", and its search index is built once per fetch and kept in memory.
+    '''
+    def __init__(self, path: Path = DATA_DIR.joinpath('playlists.sqlite3'), ttl_hours: int = PLAYLIST_CATALOG_TTL_HOURS, discovery: 'PlaylistDiscovery' = None) -> None:
+        super().__init__(path)
+        self.ttl = timedelta(hours=ttl_hours)
+        self.discovery = discovery or PlaylistDiscovery()
+        self.indexes = {}
+        self.lock = Lock()
+        with closing(self._connect()) as db, db:
+            db.execute(
+                '''CREATE TABLE IF NOT EXISTS catalogs (
+                    channel TEXT PRIMARY KEY,
+                    fetched_at TEXT
+                )'''
+                )
+            db.execute(
+                '''CREATE TABLE IF NOT EXISTS playlists (
+                    channel TEXT,
+                    position INTEGER,
+                    title TEXT,
+                    url TEXT,
+                    PRIMARY KEY (channel, position)
+                )'''
+                )
+
+    def _load(self, channel: str):
+        '''Returns the fetch time and playlists of the channel's cached catalog, or None if it is not cached or has expired.'''
+        with closing(self._connect()) as db:
+            row = db.execute(
+                'SELECT fetched_at FROM catalogs WHERE channel = ? AND fetched_at >= ?', 
+                (channel, (datetime.now() - self.ttl).isoformat())
+                ).fetchone()
+            if row is None:
+                return None
+            playlists = db.execute('SELECT title, url FROM playlists WHERE channel = ? ORDER BY position', (channel,)).fetchall()
+        return row[0], [list(playlist) for playlist in playlists]
+
+    def _fetch(self, channel_name: str):
+        '''Fetches the channel's playlists, saves them in the catalog and returns the fetch time and playlists.'''
+        channel = channel_name.lower()
+        playlists = self.discovery.get_playlists(channel_name)
+        fetched_at = datetime.now().isoformat()
+        with closing(self._connect()) as db, db:
+            db.execute('DELETE FROM playlists WHERE channel = ?', (channel,))
+            db.executemany(
+                'INSERT INTO playlists VALUES (?, ?, ?, ?)', 
+                [(channel, position, title, url) for position, (title, url) in enumerate(playlists)]
+                )
+            db.execute('INSERT OR REPLACE INTO catalogs VALUES (?, ?)', (channel, fetched_at))
+        return fetched_at, playlists
+
+    def _get_index(self, channel_name: str, refresh: bool = False):
+        '''Returns the PlaylistIndex of the channel, and whether its playlists had to be fetched for it.'''
+        channel = channel_name.lower()
+        with self.lock:
+            catalog = None if refresh else self._load(channel)
+            fetched = catalog is None
+            if fetched:
+                catalog = self._fetch(channel_name)
+            fetched_at, playlists = catalog
+            cached = self.indexes.get(channel)
+            if cached is None or cached[0] != fetched_at:
+                cached = (fetched_at, PlaylistIndex(playlists))
+                self.indexes[channel] = cached
+            return cached[1], fetched
+
+    def get_index(self, channel_name: str, refresh: bool = False):
+        '''Returns the PlaylistIndex of the channel, only fetching its playlists if the catalog is missing, expired or refresh is True.'''
+        return self._get_index(channel_name, refresh)[0]
+
+    def get_playlists(self, channel_name: str, refresh: bool = False):
+        '''Returns a [title, playlist URL] pair for every playlist of the channel.'''
+        return self.get_index(channel_name, refresh).playlists
+
+    def search(self, channel_name: str, query: str, limit: int = PLAYLIST_SUGGESTIONS, min_score: float = PLAYLIST_MATCH_MIN_SCORE):
+        '''
+        Returns the channel's best matching playlists for the query as PlaylistMatches, best first.
+        A cached catalog without a single match is fetched again, in case the playlist was made since.
+        '''
+        index, fetched = self._get_index(channel_name)
+        matches = index.search(query, limit, min_score)
+        if not matches and not fetched:
+            matches = self.get_index(channel_name, refresh=True).search(query, limit, min_score)
+        return matches
+
+
+class BatchResult:
+    '''Outcome of a batch download, as returned by BatchDownloader.'''
+    def __init__(self, engine: DownloadEngine = None, skipped: list = []) -> None:
+        self.downloaded = []
+        self.failed = []
+        self.stopped = False
+        self.skipped = list(skipped)
+        if engine is not None:
+            self.downloaded = engine.downloaded
+            self.failed = engine.failed
+            self.stopped = engine.stopped.is_set()
+
+    def to_dict(self):
+        '''Returns the result as plain, JSON serializable data.'''
+        return {
+            'downloaded' : self.downloaded,
+            'skipped' : self.skipped,
+            'failed' : [{'url' : url, 'error' : str(error)} for url, error in self.failed],
+            'stopped' : self.stopped,
+            'connection_pool' : POOL.stats()
+            }
+
+
+class PipelineFeed:
+    '''
+    The stages of a batch before the download, run by the DownloadEngine next to its workers, so video N downloads 
+    while the videos after it are still being found and resolved: the video URLs are enumerated, e.g. page by page 
+    by a VideoEnumerator, their metadata is resolved by a MetadataResolver "window" videos ahead, 
+    select(videos) picks the CachedVideos to download, and each one is queued as soon as it is picked.
+    The stages are bounded: queuing waits while the engine has max_queued jobs waiting for a worker, 
+    which pauses the resolving, and so the enumerating, behind it.
+    Without subfolders (which need the author) or select, no metadata is needed and the URLs are queued as they are found.
+    The videos already downloaded to the same folder, and the skip_urls already queued in the batch, are left out as they are found, 
+    before their metadata is resolved. With a select, the downloaded ones still go through it, mostly from the MetadataCache, 
+    so e.g. the timeframe of a channel still ends the walk, and are left out once picked. filenames maps URLs to the names to save them as.
+    '''
+    def __init__(self, downloader: 'BatchDownloader', urls, subfolders: list = None, select = None, filenames: dict = {}, window: int = METADATA_PREFETCH_WINDOW, skip_urls = ()) -> None:
+        self.downloader = downloader
+        self.urls = urls
+        self.subfolders = subfolders
+        self.select = select
+        self.filenames = filenames
+        self.skip_ids = {extract.video_id(url) for url in skip_urls}
+        # Videos found in the ledger, which only go through select
+        self.downloaded_ids = set()
+        self.resolver = None
+        if subfolders is not None or select is not None:
+            self.resolver = MetadataResolver(downloader.metadata_cache, window)
+        self.engine = None
+        self.found = 0
+        self.resolved = 0
+        self.skipped_urls = []
+        self.picked = 0
+        # Newest video picked or already downloaded, with its position, e.g. the watermark of a channel
+        self.first_url = None
+        self.first_position = None
+        # Positions of the videos on their way to being picked, by video ID
+        self.positions = {}
+        self.done = False
+
+    def stages(self):
+        '''Returns the (stage, occupancy, capacity) of the stages before the download.'''
+        stages = [('Found', self.found, None)]
+        if self.resolver is not None:
+            # Once done, the fetches still in flight were cancelled
+            stages.append(('Resolving', 0 if self.done else self.found - self.resolved, self.resolver.window))
+        return stages
+
+    def _first(self, url: str, position: int):
+        if self.first_position is None or position < self.first_position:
+            self.first_url, self.first_position = url, position
+
+    def _enumerate(self):
+        downloader = self.downloader
+        for position, url in enumerate(self.urls):
+            self.found += 1
+            video_id = extract.video_id(url)
+            if video_id in self.skip_ids:
+                # Queued in the batch before it was interrupted
+                self._first(url, position)
+                continue
+            if downloader.ledger.find(video_id, downloader.resolution, downloader.save_dir, self.subfolders, self.filenames.get(url)) is not None:
+                if self.select is None:
+                    self._first(url, position)
+                    self.skipped_urls.append(url)
+                    continue
+                self.downloaded_ids.add(video_id)
+            self.positions.setdefault(video_id, position)
+            yield url
+
+    def _resolve(self, urls):
+        with closing(self.resolver.resolve_each(urls)) as videos:
+            for url, video, error in videos:
+                if self.engine.stopped.is_set():
+                    return
+                self.resolved += 1
+                self.engine.report_progress()
+                yield url, video, error
+
+    def _selectable(self, resolved):
+        for url, video, error in resolved:
+            if error is not None:
+                # Can't tell whether the video should be downloaded
+                raise error
+            yield video
+
+    def _pick(self):
+        '''Generator of the URLs to download, in order.'''
+        if self.resolver is None:
+            yield from self._enumerate()
+            return
+        resolved = self._resolve(self._enumerate())
+        if self.select is None:
+            # Resolving only fills the MetadataCache ahead of the downloads, which report any failure themselves
+            for url, video, error in resolved:
+                yield url
+            return
+        for video in self.select(self._selectable(resolved)):
+            yield video.watch_url
+
+    def run(self, engine: 'DownloadEngine'):
+        '''Queues the videos in the engine's batch, then records the batch as fed, unless it was stopped first.'''
+        self.engine = engine
+        downloader = self.downloader
+        try:
+            with closing(self._pick()) as urls:
+                for url in urls:
+                    video_id = extract.video_id(url)
+                    self._first(url, self.positions.pop(video_id, self.found))
+                    if video_id in self.downloaded_ids:
+                        self.skipped_urls.append(url)
+                        continue
+                    self.picked += 1
+                    if not engine.add_jobs([url], downloader.save_dir, self.subfolders, downloader.resolution, downloader.connections, self.filenames):
+                        # Stopped
+                        return
+            if not engine.stopped.is_set():
+                engine.queue.set_fed(engine.batch)
+        finally:
+            self.done = True
+
+
+class BatchDownloader:
+    '''
+    Downloads single videos, playlists and channels with the DownloadEngine.
+    This is the headless core of the Video, Channel and Playlist tabs.
+    '''
+    def __init__(self, save_dir: str = os.getcwd(), resolution: str = None, workers: int = DEFAULT_DOWNLOAD_WORKERS, connections: int = 1, progress: 'ProgressReporter' = None) -> None:
+        self.save_dir = save_dir
+        self.resolution = resolution or Resolution().default_res
+        self.workers = workers
+        self.connections = connections
+        self.progress = progress or ProgressReporter()
+        self.validate = Validate()
+        self.metadata_cache = MetadataCache()
+        self.ledger = DownloadLedger()
+        self.queue = JobQueue()
+
+    def _build_downloader(self, job: Job):
+        '''
+        Returns the VideoDownloader of a queued job. Only uses what the job recorded, so it works the same after a restart.
+        In a pipelined batch the metadata was resolved ahead, and comes from the MetadataCache.
+        '''
+        folders = []
+        if job.subfolders is not None:
+            folders = [self.metadata_cache.resolve(job.url).author, *job.subfolders]
+        downloader = VideoDownloader(
+            url=job.url, 
+            resolution=job.resolution, 
+            save_directory=self.validate.validate_save_directory(job.save_dir, folders)
+            )
+        downloader.set_connections(job.connections)
+        downloader.set_store(VideoStore(Path(job.save_dir).joinpath(STORE_DIR_NAME)))
+        if job.filename is not None:
+            # Saved as named, without the resolution prefix
+            downloader.set_output_filename(job.filename)
+        else:
+            downloader.add_resolution_prefix()
+        return downloader
+
+    def _run_batch(self, batch: str, feed: PipelineFeed = None):
+        engine = DownloadEngine(self.workers, self.ledger, self.queue)
+        engine.run(batch, self._build_downloader, self.progress, feed)
+        # Frees the stored videos whose files were deleted from the save folders since
+        VideoStore(Path(self.save_dir).joinpath(STORE_DIR_NAME)).prune()
+        if feed is None:
+            return BatchResult(engine)
+        if engine.feed_error is not None:
+            # Running the feed again would fail the same way, so the batch is not offered to be resumed
+            self.queue.discard(batch)
+            raise engine.feed_error
+        return BatchResult(engine, feed.skipped_urls)
+
+    def _download_pipelined(self, feed: PipelineFeed, title: str, priority: int, source: dict):
+        '''Runs the feed in a new batch, which records its source, so an interrupted feed can be run again by resume.'''
+        batch = self.queue.add_batch([], title, self.save_dir, feed.subfolders, self.resolution, self.connections, priority, source=source)
+        return self._run_batch(batch, feed)
+
+    def _build_feed(self, source: dict, skip_urls = ()):
+        '''
+        Returns the PipelineFeed of a batch source, one of: 
+        {"type": "urls", "urls", "subfolders", "filenames"}, {"type": "playlist", "url", "subfolders"} 
+        or {"type": "channel", "name", "timeframe", "keywords", "until_video_id"}.
+        '''
+        if source['type'] == 'channel':
+            # Checks the keywords before any request is made
+            channel_filter = ChannelFilter(self.metadata_cache, source['timeframe'], source['keywords'])
+            channel = Channel(f"https://www.youtube.com/c/{source['name']}")
+            return PipelineFeed(self, VideoEnumerator(channel, source['until_video_id']), [], channel_filter.select, skip_urls=skip_urls)
+        if source['type'] == 'playlist':
+            return PipelineFeed(self, VideoEnumerator(Playlist(source['url'])), source['subfolders'], skip_urls=skip_urls)
+        return PipelineFeed(self, source['urls'], source['subfolders'], filenames=source['filenames'], skip_urls=skip_urls)
+
+    def _set_channel_watermark(self, source: dict, feed: PipelineFeed, result: BatchResult, failed_before: int = 0):
+        if source['type'] != 'channel' or feed.first_url is None:
+            return
+        if not result.stopped and len(result.failed) == 0 and failed_before == 0:
+            # Everything up to the newest video is downloaded, the next incremental sync can stop there
+            self.ledger.set_watermark(source['name'], extract.video_id(feed.first_url))
+
+    def download_urls(self, urls, subfolders: list = None, title: str = 'Videos', priority: int = JOB_PRIORITY_BATCH, filenames: dict = {}):
+        '''
+        Downloads the videos as a batch, skipping the ones already downloaded to the same folder.
+        urls may be lazy, e.g. a VideoEnumerator: the videos are queued and downloaded while the rest are still found, see PipelineFeed.
+        Without subfolders the videos are saved straight into the save directory, 
+        otherwise into "<save directory>/<author>/<subfolders>". filenames maps URLs to the names to save them as.
+        '''
+        if isinstance(urls, VideoEnumerator):
+            source = {'type' : 'playlist', 'url' : urls.playlist.playlist_url, 'subfolders' : subfolders}
+        else:
+            urls = list(urls)
+            for url in urls:
+                # Raises RegexMatchError for anything but a video URL, before the batch is queued
+                extract.video_id(url)
+            source = {'type' : 'urls', 'urls' : urls, 'subfolders' : subfolders, 'filenames' : filenames}
+        return self._download_pipelined(PipelineFeed(self, urls, subfolders, filenames=filenames), title, priority, source)
+
+    def download_video_list(self, videos: VideoList, title: str = 'Video list'):
+        '''
+        Downloads the videos of the list as one batch, straight into the save directory, under the file names given with them.
+        '''
+        if len(videos.entries) == 0:
+            raise NoVideosFoundError('No video URLs in the list')
+        return self.download_urls(videos.urls(), title=title, priority=JOB_PRIORITY_VIDEO, filenames=videos.filenames())
+
+    def unfinished_batches(self):
+        '''Returns the [batch ID, title, jobs left, fed] of every batch interrupted by the app closing.'''
+        return self.queue.unfinished_batches()
+
+    def resume(self, batch: str):
+        '''
+        Continues an interrupted batch where it stopped, with the options it was queued with.
+        If its videos were still being found, they are found again from its source, leaving out the ones already in the batch.
+        '''
+        self.queue.recover(batch)
+        source = self.queue.get_source(batch)
+        if source is None:
+            return self._run_batch(batch)
+        feed = self._build_feed(source, self.queue.urls(batch))
+        failed_before = self.queue.counts(batch).get('failed', 0)
+        result = self._run_batch(batch, feed)
+        self._set_channel_watermark(source, feed, result, failed_before)
+        return result
+
+    def resume_all(self):
+        '''Continues every interrupted batch, one after the other, and returns their combined BatchResult.'''
+        result = BatchResult()
+        for batch, title, jobs_left, fed in self.unfinished_batches():
+            self.progress.update_status(f'Resuming {title}')
+            batch_result = self.resume(batch)
+            result.downloaded += batch_result.downloaded
+            result.failed += batch_result.failed
+            if batch_result.stopped:
+                result.stopped = True
+                break
+        return result
+
+    @PROFILER.profiled
+    def download_playlist(self, url: str):
+        '''Downloads every video of the playlist into "<save directory>/<author>/<playlist title>".'''
+        self.progress.update_status('Searching for playlist')
+        playlist = Playlist(url)
+
+        self.progress.update_status('Finding videos in playlist')
+        videos = VideoEnumerator(playlist)
+        try:
+            # Only reads the first page of the playlist
+            if videos.is_empty():
+                raise InvalidPlaylistError(url)
+            title = playlist.title
+        except (exceptions.RegexMatchError, KeyError, IndexError):
+            # Not a playlist URL, or not a playlist page
+            raise InvalidPlaylistError(url)
+
+        return self.download_urls(videos, [title], title=title)
+
+    @PROFILER.profiled
+    def download_channel(self, channel_name: str, timeframe: str = 'All Time', keywords: str = '', incremental: bool = False):
+        '''
+        Downloads the videos of the channel which meet the timeframe and keywords given, into "<save directory>/<author>".
+        If incremental, only the videos newer than the newest one downloaded from the channel last time are considered.
+        '''
+        channel_name = self.validate.validate_channel_name(channel_name)
+        watermark = None
+        if incremental:
+            watermark = self.ledger.get_watermark(channel_name)
+        source = {'type' : 'channel', 'name' : channel_name, 'timeframe' : timeframe, 'keywords' : keywords, 'until_video_id' : watermark}
+        feed = self._build_feed(source)
+
+        self.progress.update_status('Searching for channel')
+        # Only reads the first page of the channel
+        if feed.urls.is_empty():
+            raise InvalidChannelError(channel_name)
+
+        # The videos are filtered while the first matches already download
+        self.progress.update_status('Looking for videos')
+        result = self._download_pipelined(feed, channel_name, JOB_PRIORITY_BATCH, source)
+        self._set_channel_watermark(source, feed, result)
+        if feed.picked == 0 and len(feed.skipped_urls) == 0:
+            raise NoVideosFoundError(channel_name)
+        return result